@@ -1,11 +1,10 @@
-import json
 import cv2
 import time
-import os
 import numpy as np
 import psutil
+from event_log import get_event_log
 
-LOG_FILE = "log.json"
+LOG_FILE = "log.jsonl"
 
 # Raspberry Pi-Specific Thresholds
 LOW_BRIGHTNESS_THRESHOLD = 40  # Adjusted for Pi Camera
@@ -17,15 +16,20 @@ HIGH_TEMP_THRESHOLD = 65  # °C threshold for Raspberry Pi
 HIGH_RAM_USAGE = 85  # Lowered to avoid Pi crashes
 HIGH_DISK_USAGE = 85  # Adjusted for small SD card storage
 
-def get_video_warnings():
-    cap = cv2.VideoCapture(0, cv2.CAP_V4L2)  # Ensures compatibility with Pi Camera
-    if not cap.isOpened():
-        return ["Camera not accessible"]
-
-    ret, frame = cap.read()
-    cap.release()
-    if not ret:
-        return ["Camera frame not available"]
+def get_video_warnings(frame=None):
+    """
+    Standalone check of a single frame. While the sensor loop is running, use
+    health_monitor instead: this opens the camera when no frame is given.
+    """
+    if frame is None:
+        cap = cv2.VideoCapture(0, cv2.CAP_V4L2)  # Ensures compatibility with Pi Camera
+        if not cap.isOpened():
+            return ["Camera not accessible"]
+
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            return ["Camera frame not available"]
 
     warnings = []
 
@@ -62,7 +66,7 @@ def get_system_warnings():
     warnings = []
 
     # 1️⃣ High CPU Usage
-    cpu_usage = psutil.cpu_percent(interval=1)
+    cpu_usage = psutil.cpu_percent(interval=None)  # non-blocking: usage since the previous call
     if cpu_usage > HIGH_CPU_USAGE:
         warnings.append(f"High CPU usage: {cpu_usage}%")
 
@@ -97,27 +101,13 @@ def update_warnings():
     if not all_warnings:
         return  # No warnings, nothing to log
 
-    # Read existing log data if available
-    logs = []
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            try:
-                logs = json.load(f)
-            except json.JSONDecodeError:
-                pass  # Ignore corrupted logs
-
-    # Append new warning entry
-    log_entry = {
-        "Timestamp": timestamp,
-        "Warnings": all_warnings
-    }
-    logs.append(log_entry)
-
-    # Save updated log file
-    with open(LOG_FILE, "w") as f:
-        json.dump(logs, f, indent=4)
+    # Append a single line to the event log
+    log_entry = get_event_log(LOG_FILE).write_warnings(all_warnings, Timestamp=timestamp)
 
     print("Log updated:", log_entry)
 
-# Run the warning check
-update_warnings()
+if __name__ == "__main__":
+    # Run the warning check
+    psutil.cpu_percent(interval=None)
+    time.sleep(1)  # give cpu_percent a measurement window
+    update_warnings()
@@ -0,0 +1,216 @@
+import time
+import wave
+import queue
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pyaudio
+
+logger = logging.getLogger(__name__)
+
+# timestamp: time.time() of the end of the loudest window, peak: max |sample|, rms: window RMS
+AudioEvent = namedtuple("AudioEvent", ["timestamp", "peak", "rms"])
+
+
+class AudioRingBuffer:
+    """
+    Single-producer / single-consumer ring of int16 samples.
+    The producer (PyAudio callback) copies samples in and then advances a monotonically
+    increasing write counter; the consumer reads everything between its own position and
+    that counter. No lock is shared, so the audio callback can never block on a reader.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.written = 0  # total samples ever written
+
+    def write(self, samples):
+        total = len(samples)
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (self.written + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.written += total
+
+    def read_since(self, position):
+        """Returns (samples, new_position). Data older than one ring length is dropped."""
+        end = self.written
+        position = max(position, end - self.capacity)
+        n = end - position
+        if n <= 0:
+            return np.empty(0, dtype=np.int16), end
+        start = position % self.capacity
+        first = min(n, self.capacity - start)
+        if first == n:
+            return self.buffer[start:start + n].copy(), end
+        return np.concatenate((self.buffer[start:], self.buffer[:n - first])), end
+
+
+class AudioMonitor:
+    """
+    Captures microphone audio on its own callback-mode PyAudio stream.
+
+    The callback only copies samples into an AudioRingBuffer. A metering thread drains
+    the ring, computes peak and RMS over sliding windows (window_ms long, half-window hop)
+    in one vectorised pass, forwards the raw audio to on_audio_data (e.g. the clip
+    pre-roll) and puts an AudioEvent on a queue whenever a window exceeds the threshold.
+    The detection loop polls that queue and never blocks on audio I/O.
+    """
+
+    def __init__(self, rate=48000, channels=1, chunk=512, device_index=None, threshold=25000,
+                 window_ms=50, ring_seconds=10, poll_interval=0.02, on_audio_data=None):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.device_index = device_index
+        self.threshold = threshold
+        self.window = max(1, int(rate * channels * window_ms / 1000))
+        self.hop = max(1, self.window // 2)
+        self.poll_interval = poll_interval
+        self.on_audio_data = on_audio_data
+        self.ring = AudioRingBuffer(int(rate * channels * ring_seconds))
+        self.events = queue.Queue(maxsize=256)
+        self.peak = 0
+        self.rms = 0.0
+        self.overflows = 0
+        self.pa = None
+        self.stream = None
+        self.running = False
+        self.thread = None
+        self._tail = np.empty(0, dtype=np.int16)
+
+    def start(self):
+        self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paInt16,
+                                   channels=self.channels,
+                                   rate=self.rate,
+                                   input=True,
+                                   input_device_index=self.device_index,
+                                   frames_per_buffer=self.chunk,
+                                   stream_callback=self._callback)
+        self.running = True
+        self.thread = threading.Thread(target=self._meter_loop, daemon=True)
+        self.thread.start()
+        self.stream.start_stream()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+        if self.pa is not None:
+            self.pa.terminate()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return None, pyaudio.paContinue
+
+    def _meter_loop(self):
+        position = 0
+        while self.running:
+            samples, position = self.ring.read_since(position)
+            if len(samples):
+                if callable(self.on_audio_data):
+                    try:
+                        self.on_audio_data(samples.tobytes())
+                    except Exception as e:
+                        logger.error(f"[Audio] on_audio_data failed: {e}")
+                self._meter(samples)
+            time.sleep(self.poll_interval)
+
+    def _meter(self, samples):
+        data = np.concatenate((self._tail, samples)) if len(self._tail) else samples
+        if len(data) < self.window:
+            self._tail = data
+            return
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.window)[::self.hop]
+        consumed = len(windows) * self.hop
+        self._tail = data[consumed:]
+
+        wide = windows.astype(np.int32)
+        peaks = np.abs(wide).max(axis=1)
+        rms = np.sqrt(np.mean(np.square(wide, dtype=np.float64), axis=1))
+        self.peak = int(peaks[-1])
+        self.rms = float(rms[-1])
+
+        loud = np.flatnonzero(peaks > self.threshold)
+        if len(loud):
+            i = loud[np.argmax(peaks[loud])]
+            event = AudioEvent(time.time(), int(peaks[i]), float(rms[i]))
+            try:
+                self.events.put_nowait(event)
+            except queue.Full:
+                pass  # the loop is already behind on events; the trigger is pending anyway
+
+    def poll(self):
+        """Returns all loud-noise events queued since the last poll (non-blocking)."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+
+def wav_format(path):
+    """(rate, channels) of a 16-bit PCM WAV file."""
+    with wave.open(str(path), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files can be replayed")
+        return wf.getframerate(), wf.getnchannels()
+
+
+class ReplayAudioMonitor(AudioMonitor):
+    """
+    Plays a WAV file into the same ring buffer, metering and events as the microphone,
+    at speed x real time, so the detection loop can run without audio hardware.
+    """
+
+    def __init__(self, wav_path, speed=1.0, loop=False, chunk=512, threshold=25000, window_ms=50,
+                 ring_seconds=10, poll_interval=0.02, on_audio_data=None):
+        rate, channels = wav_format(wav_path)
+        super().__init__(rate=rate, channels=channels, chunk=chunk, threshold=threshold, window_ms=window_ms,
+                         ring_seconds=ring_seconds, poll_interval=poll_interval, on_audio_data=on_audio_data)
+        self.wav_path = str(wav_path)
+        self.speed = speed
+        self.loop = loop
+        self.feeder = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._meter_loop, daemon=True)
+        self.thread.start()
+        self.feeder = threading.Thread(target=self._feed_loop, name="audio-replay", daemon=True)
+        self.feeder.start()
+
+    def stop(self):
+        self.running = False
+        if self.feeder is not None:
+            self.feeder.join(timeout=1)
+        super().stop()
+
+    def _feed_loop(self):
+        interval = self.chunk / self.rate / self.speed
+        next_chunk = time.monotonic()
+        while self.running:
+            with wave.open(self.wav_path, "rb") as wf:
+                while self.running:
+                    data = wf.readframes(self.chunk)
+                    if not data:
+                        break
+                    self.ring.write(np.frombuffer(data, dtype=np.int16))
+                    next_chunk += interval
+                    time.sleep(max(0.0, next_chunk - time.monotonic()))
+            if not self.loop:
+                break
@@ -0,0 +1,209 @@
+"""
+Runs the same clips through the PyTorch checkpoint, the float ONNX model and the
+quantized ONNX model, across thread counts and batch sizes.
+
+Usage:
+    python benchmarks/bench_backends.py --onnx model.onnx --quantized model_quantized.onnx
+    python benchmarks/bench_backends.py --clips videos/*.mp4 --threads 1 2 4 --batch-sizes 1 4 \\
+        --pth pc_model_training/activity_detection_model.pth --training-dir pc_model_training \\
+        --output bench.json --compare bench_prev.json
+
+Without --clips, synthetic clips are written to a temporary folder, so it runs on any
+x86 Linux box. Decode (sample_frames) and preprocess (resize + normalise) are timed
+separately from model time. Each backend/thread configuration runs in a fresh process,
+so its peak RSS is its own. The PyTorch backend needs torch and the training code
+(--training-dir, the extracted pc_model_training.zip); it is skipped otherwise.
+Results are written as JSON that can be compared between commits with --compare.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing as mp
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+NUM_FRAMES = 5
+
+def make_synthetic_clips(folder, count=4, seconds=4, fps=15, size=(640, 480)):
+    """Moving-noise MP4s, so decode cost is realistic without shipping footage."""
+    import cv2
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"synthetic_{i}.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        base = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        for f in range(seconds * fps):
+            writer.write(np.roll(base, f * 4, axis=1))
+        writer.release()
+        paths.append(path)
+    return paths
+
+def percentiles(samples_ms):
+    return {"p50_ms": float(np.percentile(samples_ms, 50)), "p95_ms": float(np.percentile(samples_ms, 95)),
+            "mean_ms": float(np.mean(samples_ms))}
+
+def bench_pipeline(clips, repeats):
+    """Decode and preprocess time per clip (independent of the backend)."""
+    from frame_sampler import sample_frames, preprocess_frames
+    decode_ms, preprocess_ms, inputs = [], [], []
+    for _ in range(repeats):
+        for clip in clips:
+            start = time.perf_counter()
+            frames = sample_frames(clip, NUM_FRAMES)
+            decoded = time.perf_counter()
+            x = preprocess_frames(frames)
+            done = time.perf_counter()
+            decode_ms.append((decoded - start) * 1000)
+            preprocess_ms.append((done - decoded) * 1000)
+    for clip in clips:
+        inputs.append(preprocess_frames(sample_frames(clip, NUM_FRAMES)))
+    return {"decode": percentiles(decode_ms), "preprocess": percentiles(preprocess_ms)}, np.concatenate(inputs)
+
+def make_batch(samples, batch_size):
+    reps = -(-batch_size // len(samples))
+    return np.ascontiguousarray(np.tile(samples, (reps, 1, 1, 1, 1))[:batch_size])
+
+def peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+def load_runner(backend, path, threads, training_dir):
+    """Returns (run(batch) -> None, max_batch) where max_batch is None for a dynamic batch axis."""
+    if backend == "pytorch":
+        import torch
+        import torchvision.models as models
+        sys.path.insert(0, training_dir)
+        from multitask_model import MultiTaskModel
+        torch.set_num_threads(threads)
+        model = MultiTaskModel(models.mobilenet_v2(), num_frames=NUM_FRAMES)
+        model.load_state_dict(torch.load(path, map_location="cpu"))
+        model.eval()
+
+        def run(batch):
+            with torch.inference_mode():
+                model(torch.from_numpy(batch))
+        return run, None
+
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    batch_dim = model_input.shape[0]
+
+    def run(batch):
+        session.run(None, {model_input.name: batch})
+    return run, batch_dim if isinstance(batch_dim, int) else None
+
+def bench_backend(backend, path, threads, batch_sizes, samples, iterations, warmup, training_dir):
+    """Runs in a child process; returns one result row per batch size."""
+    run, fixed_batch = load_runner(backend, path, threads, training_dir)
+    rows = []
+    for batch_size in batch_sizes:
+        row = {"backend": backend, "model": os.path.basename(path), "threads": threads, "batch": batch_size}
+        if fixed_batch is not None and batch_size != fixed_batch:
+            rows.append(dict(row, skipped="model has a fixed batch axis"))
+            continue
+        batch = make_batch(samples, batch_size)
+        for _ in range(warmup):
+            run(batch)
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            run(batch)
+            times.append((time.perf_counter() - start) * 1000)
+        stats = percentiles(times)
+        rows.append(dict(row, **stats, ms_per_clip=stats["mean_ms"] / batch_size,
+                         clips_per_s=1000 * batch_size / stats["mean_ms"]))
+    for row in rows:
+        row["peak_rss_mb"] = peak_rss_mb()
+    return rows
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_rows(rows, previous=None):
+    prev = {(r["backend"], r["threads"], r["batch"]): r for r in (previous or []) if "skipped" not in r}
+    print(f"{'backend':<10} {'thr':>3} {'batch':>5} {'p50 ms':>8} {'p95 ms':>8} {'ms/clip':>8} {'clips/s':>8} {'RSS MB':>7}"
+          + (f" {'vs prev':>8}" if previous else ""))
+    for r in rows:
+        if "skipped" in r:
+            print(f"{r['backend']:<10} {r['threads']:>3} {r['batch']:>5}  skipped: {r['skipped']}")
+            continue
+        line = (f"{r['backend']:<10} {r['threads']:>3} {r['batch']:>5} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}"
+                f" {r['ms_per_clip']:>8.1f} {r['clips_per_s']:>8.2f} {r['peak_rss_mb']:>7.0f}")
+        old = prev.get((r["backend"], r["threads"], r["batch"]))
+        if old:
+            line += f" {100 * (r['clips_per_s'] / old['clips_per_s'] - 1):>+7.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", nargs="*", default=[], help="clips to run (default: synthetic)")
+    parser.add_argument("--pth", default="activity_detection_model.pth")
+    parser.add_argument("--training-dir", default=os.path.join(ROOT, "pc_model_training"),
+                        help="folder containing multitask_model.py")
+    parser.add_argument("--onnx", default="model.onnx")
+    parser.add_argument("--quantized", default="model_quantized.onnx")
+    parser.add_argument("--threads", nargs="*", type=int, default=[1, 2, 4])
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[1, 4])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", default="bench_backends.json")
+    parser.add_argument("--compare", default=None, help="previous JSON result to compare throughput against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clips = args.clips or make_synthetic_clips(tmp)
+        pipeline, samples = bench_pipeline(clips, repeats=3)
+
+    backends = []
+    if os.path.exists(args.pth) and os.path.exists(os.path.join(args.training_dir, "multitask_model.py")):
+        backends.append(("pytorch", args.pth))
+    else:
+        print(f"Skipping PyTorch backend ({args.pth} or {args.training_dir}/multitask_model.py not found).")
+    for name, path in (("onnx", args.onnx), ("quantized", args.quantized)):
+        if os.path.exists(path):
+            backends.append((name, path))
+        else:
+            print(f"Skipping {name} backend ({path} not found).")
+
+    print(f"Clips: {len(clips)}  decode p50 {pipeline['decode']['p50_ms']:.1f} ms  "
+          f"preprocess p50 {pipeline['preprocess']['p50_ms']:.1f} ms")
+    rows = []
+    ctx = mp.get_context("spawn")
+    for backend, path in backends:
+        for threads in args.threads:
+            with ctx.Pool(1) as pool:
+                rows += pool.apply(bench_backend, (backend, path, threads, args.batch_sizes, samples,
+                                                   args.iterations, args.warmup, args.training_dir))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    print_rows(rows, previous)
+
+    report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "machine": platform.machine(), "processor": platform.processor(), "cpu_count": os.cpu_count(),
+              "clips": len(clips), "synthetic": not args.clips, "pipeline": pipeline, "results": rows}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares ONNX Runtime throughput (clips/s) at different batch sizes on CPU.
+
+Usage:
+    python benchmarks/bench_batch_inference.py --model model_quantized.onnx
+    python benchmarks/bench_batch_inference.py --model model.onnx --clips videos/1.mp4
+
+Without --clips a synthetic (batch, 5, 3, 224, 224) input is used, so only model
+time is measured. With --clips the clips are preprocessed once and tiled into batches.
+The model must be exported with a dynamic batch axis (see convert_onnx_and_quantize.py)
+for batch sizes above 1.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import onnxruntime as ort
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+NUM_FRAMES = 5
+
+def load_inputs(clips, num_frames):
+    if not clips:
+        rng = np.random.default_rng(0)
+        return rng.standard_normal((1, num_frames, 3, 224, 224), dtype=np.float32)
+    from frame_sampler import sample_frames, preprocess_frames
+    return np.concatenate([preprocess_frames(sample_frames(c, num_frames)) for c in clips])
+
+def make_batch(samples, batch_size):
+    reps = -(-batch_size // len(samples))
+    return np.ascontiguousarray(np.tile(samples, (reps, 1, 1, 1, 1))[:batch_size])
+
+def bench(session, batch, iterations, warmup):
+    input_name = session.get_inputs()[0].name
+    for _ in range(warmup):
+        session.run(None, {input_name: batch})
+    start = time.perf_counter()
+    for _ in range(iterations):
+        session.run(None, {input_name: batch})
+    elapsed = time.perf_counter() - start
+    return elapsed / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="model_quantized.onnx")
+    parser.add_argument("--clips", nargs="*", default=[])
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = ORT default)")
+    args = parser.parse_args()
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = args.threads
+    session = ort.InferenceSession(args.model, options, providers=["CPUExecutionProvider"])
+    batch_dim = session.get_inputs()[0].shape[0]
+    samples = load_inputs(args.clips, NUM_FRAMES)
+
+    print(f"Model: {args.model} (batch axis: {batch_dim})")
+    print(f"{'batch':>5} {'ms/call':>10} {'ms/clip':>10} {'clips/s':>10}")
+    for batch_size in args.batch_sizes:
+        if isinstance(batch_dim, int) and batch_size != batch_dim:
+            print(f"{batch_size:>5} {'skipped: model has a fixed batch axis':>32}")
+            continue
+        per_call = bench(session, make_batch(samples, batch_size), args.iterations, args.warmup)
+        print(f"{batch_size:>5} {per_call * 1000:>10.1f} {per_call * 1000 / batch_size:>10.1f} {batch_size / per_call:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares the motion detectors on recorded footage: frames/s and CPU% of this process.
+
+Usage:
+    python benchmarks/bench_motion.py videos/1.mp4
+    python benchmarks/bench_motion.py footage.mp4 --methods framediff running_average mog2 --max-skip 0
+
+Frames are decoded once up front so only detection cost is measured. CPU% is
+process CPU time over wall time (100% = one full core).
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from motion_detector import create_detector
+
+def load_frames(path, width, height, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame.shape[1] != width or frame.shape[0] != height:
+            frame = cv2.resize(frame, (width, height))
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def bench(detector, frames, repeats):
+    triggered = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        detector.reset()
+        for frame in frames:
+            if detector.detect(frame).detected:
+                triggered += 1
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    n = len(frames) * repeats
+    return n / wall, 100.0 * cpu / wall, triggered / n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--methods", nargs="*", default=["framediff", "running_average", "mog2"])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--scale", type=float, default=0.25)
+    parser.add_argument("--max-skip", type=int, default=3)
+    parser.add_argument("--max-frames", type=int, default=900)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1, help="cv2.setNumThreads (1 approximates one Pi core)")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    frames = load_frames(args.video, args.width, args.height, args.max_frames)
+    if not frames:
+        sys.exit(f"No frames decoded from {args.video}")
+
+    print(f"{len(frames)} frames at {args.width}x{args.height}, {args.repeats} repeats, {args.threads} OpenCV thread(s)")
+    print(f"{'method':>16} {'frames/s':>10} {'CPU%':>8} {'triggered':>10}")
+    for method in args.methods:
+        if method == "framediff":
+            detector = create_detector(method)
+        else:
+            detector = create_detector(method, scale=args.scale, max_skip=args.max_skip)
+        fps, cpu, triggered = bench(detector, frames, args.repeats)
+        print(f"{method:>16} {fps:>10.1f} {cpu:>7.1f}% {triggered:>9.1%}")
+
+if __name__ == "__main__":
+    main()
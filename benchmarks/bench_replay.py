@@ -0,0 +1,330 @@
+"""
+Hardware-free end-to-end run of the Pi pipeline: replays an MP4 (and optionally a WAV)
+through the real sensor_input detection loop, RecorderModule and uploader into a locally
+started httpServer, and measures trigger-to-dashboard latency per event.
+
+Usage:
+    python benchmarks/bench_replay.py --video videos/1.mp4 --model model_quantized.onnx
+    python benchmarks/bench_replay.py --video footage.mp4 --audio footage.wav --speed 4 --duration 120 \\
+        --workers 2 --batch-size 4 --output replay.json --compare replay_prev.json --max-regression 20
+
+The video is played once (or looped for --duration seconds) at --speed x real time;
+the clip length is scaled so clips hold the same footage at any speed. Everything the
+run writes (recordings, queue and cache databases, outbox, server catalog and uploads)
+goes to a temporary folder. A clip counts as visible once /api/videos lists it; the
+dashboard is polled every --poll seconds, which bounds the latency resolution.
+
+Reports per-event latency (p50/p95/max), mean time to each stage from the trace-id
+histograms, detection fps, peak/mean queue depths and CPU of the Pi process and the
+server. Results are written as JSON with the git commit. With --compare, the run exits
+with status 1 if p95 latency or detection fps regressed by more than --max-regression %.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import psutil
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+SERVER = r"""
+import sys
+sys.path.insert(0, {root!r})
+import httpServer
+httpServer.app.run(host="127.0.0.1", port={port}, threaded=True, debug=False, use_reloader=False)
+"""
+
+STAGES = ("trigger_to_clip_seconds", "trigger_to_watchdog_seconds", "trigger_to_inference_seconds",
+          "trigger_to_upload_seconds")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(folder, port, timeout=30):
+    """httpServer in its own process, with its uploads and catalog in folder."""
+    log = open(os.path.join(folder, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, "-c", SERVER.format(root=ROOT, port=port)], cwd=folder,
+                            stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"httpServer exited with code {proc.returncode}; see {log.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/videos", timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("httpServer did not start")
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "max": float(np.max(values)), "mean": float(np.mean(values))}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class DashboardWatcher(threading.Thread):
+    """Polls /api/videos and records when each trace id first becomes visible."""
+
+    def __init__(self, port, interval):
+        super().__init__(daemon=True)
+        self.url = f"http://127.0.0.1:{port}/api/videos?limit=100"
+        self.interval = interval
+        self.seen = {}  # trace id -> time.time() first listed
+        self.running = True
+
+    def run(self):
+        from metrics import trace_id_from_name
+        while self.running:
+            try:
+                videos = requests.get(self.url, timeout=5).json()["videos"]
+                now = time.time()
+                for video in videos:
+                    trace_id = trace_id_from_name(video.get("source_name") or "")
+                    if trace_id and trace_id not in self.seen:
+                        self.seen[trace_id] = now
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+            time.sleep(self.interval)
+
+
+class Sampler(threading.Thread):
+    """Queue depths and CPU once a second."""
+
+    def __init__(self, recorder, server_pid):
+        super().__init__(daemon=True)
+        self.recorder = recorder
+        self.pi = psutil.Process()
+        self.server = psutil.Process(server_pid)
+        self.samples = []
+        self.running = True
+
+    def run(self):
+        from sendFile import get_uploader
+        self.pi.cpu_percent(None)
+        self.server.cpu_percent(None)
+        psutil.cpu_percent(None)
+        while self.running:
+            time.sleep(1)
+            self.samples.append({
+                "work_queue": self.recorder.work_queue.depth(),
+                "validation_queue": self.recorder.validation_queue.qsize(),
+                "upload_queue": get_uploader().pending(),
+                "pi_cpu": self.pi.cpu_percent(None),
+                "server_cpu": self.server.cpu_percent(None),
+                "system_cpu": psutil.cpu_percent(None),
+            })
+
+    def summary(self):
+        result = {}
+        for key in ("work_queue", "validation_queue", "upload_queue", "pi_cpu", "server_cpu", "system_cpu"):
+            values = [s[key] for s in self.samples] or [0]
+            result[key] = {"mean": float(np.mean(values)), "max": float(np.max(values))}
+        return result
+
+
+def run(args, workdir):
+    pi_dir = os.path.join(workdir, "pi")
+    server_dir = os.path.join(workdir, "server")
+    recordings = os.path.join(pi_dir, "recordings")
+    os.makedirs(recordings)
+    os.makedirs(server_dir)
+
+    port = free_port()
+    server = start_server(server_dir, port)
+    try:
+        # Point the Pi side at the temporary folder and the local server before it is imported
+        os.environ["UPLOAD_SERVER_URL"] = f"http://127.0.0.1:{port}/upload"
+        os.environ["UPLOAD_OUTBOX_DIR"] = os.path.join(pi_dir, "outbox")
+        stderr = sys.stderr
+        os.chdir(pi_dir)  # recorder.log
+        import recorder_module
+        import sensor_input
+        from metrics import histogram, trace_id_from_name, trace_start_time
+        sys.stderr = stderr  # recorder_module silences stderr (ALSA noise); keep ours
+        recorder_module.INFERENCE_LOG_FILE = os.path.join(pi_dir, "inference_results.jsonl")
+        recorder_module.WARNING_JSON_DIR = pi_dir
+        recorder_module.WARNING_LOG_FILE = os.path.join(pi_dir, "log.jsonl")
+
+        kwargs = {"inference_workers": args.workers} if args.workers else {}
+        if args.batch_size:
+            kwargs["batch_size"] = args.batch_size
+        recorder = recorder_module.RecorderModule(
+            save_dir=recordings, ai_model_path=args.model, metrics_port=0,
+            cache_db=os.path.join(pi_dir, "inference_cache.db"), queue_db=os.path.join(pi_dir, "work_queue.db"),
+            **kwargs)
+
+        camera = {"source": args.video, "output_dir": recordings, "speed": args.speed,
+                  "loop": args.duration is not None, "audio": False,
+                  "record_duration": sensor_input.RECORD_DURATION / args.speed}
+        if args.audio:
+            camera["audio_file"] = args.audio
+        if args.motion_area_threshold:
+            camera["motion_area_threshold"] = args.motion_area_threshold
+
+        watcher = DashboardWatcher(port, args.poll)
+        watcher.start()
+        sampler = Sampler(recorder, server.pid)
+        sampler.start()
+
+        stop = threading.Event()
+        loop = threading.Thread(target=sensor_input.main, daemon=True,
+                                kwargs={"camera": camera, "is_backlogged": recorder.is_backlogged, "stop": stop})
+        detection = histogram("detection_loop_seconds")
+        frames_before = detection.count
+        started = time.time()
+        loop.start()
+        loop.join(args.duration)
+        stop.set()
+        loop.join()
+        replay_seconds = time.time() - started
+        frames = detection.count - frames_before
+        print(f"Replay finished after {replay_seconds:.1f}s; waiting up to {args.drain_timeout}s for clips to reach the dashboard...")
+
+        # Clips still being encoded show up in the folder a little after the loop stops
+        deadline = time.time() + args.drain_timeout
+        triggered = set()
+        while time.time() < deadline:
+            triggered = {trace_id_from_name(n) for n in os.listdir(recordings) if trace_id_from_name(n)}
+            busy = recorder.work_queue.depth() or recorder.validation_queue.qsize()
+            if triggered and triggered <= set(watcher.seen) and not busy:
+                break
+            time.sleep(0.5)
+        watcher.running = False
+        sampler.running = False
+
+        events = []
+        for trace_id in sorted(triggered):
+            seen = watcher.seen.get(trace_id)
+            trigger = trace_start_time(trace_id)
+            events.append({"trace_id": trace_id, "trigger": trigger,
+                           "latency_s": seen - trigger if seen else None})
+        latencies = [e["latency_s"] for e in events if e["latency_s"] is not None]
+        stages = {}
+        for name in STAGES:
+            h = histogram(name)
+            stages[name] = h.sum / h.count if h.count else None
+        return {
+            "replay_seconds": replay_seconds,
+            "detection_fps": frames / replay_seconds if replay_seconds else 0.0,
+            "events": len(events),
+            "missing": len(events) - len(latencies),
+            "latency": percentiles(latencies),
+            "stage_mean_seconds": stages,
+            "resources": sampler.summary(),
+            "work_queue": recorder.work_queue.stats(),
+            "per_event": events,
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+def print_report(result):
+    lat = result["latency"]
+    print(f"\nEvents: {result['events']} ({result['missing']} never reached the dashboard)")
+    if lat["count"]:
+        print(f"Trigger -> dashboard: p50 {lat['p50']:.2f}s  p95 {lat['p95']:.2f}s  max {lat['max']:.2f}s")
+    for name, mean in result["stage_mean_seconds"].items():
+        if mean is not None:
+            print(f"  {name:<32} mean {mean:.2f}s")
+    print(f"Detection: {result['detection_fps']:.1f} fps over {result['replay_seconds']:.1f}s")
+    res = result["resources"]
+    print(f"Queues (mean/max): work {res['work_queue']['mean']:.1f}/{res['work_queue']['max']:.0f}  "
+          f"validation {res['validation_queue']['mean']:.1f}/{res['validation_queue']['max']:.0f}  "
+          f"upload {res['upload_queue']['mean']:.1f}/{res['upload_queue']['max']:.0f}")
+    print(f"CPU % (mean/max): pi {res['pi_cpu']['mean']:.0f}/{res['pi_cpu']['max']:.0f}  "
+          f"server {res['server_cpu']['mean']:.0f}/{res['server_cpu']['max']:.0f}  "
+          f"system {res['system_cpu']['mean']:.0f}/{res['system_cpu']['max']:.0f}")
+
+def regressions(result, previous, max_regression):
+    """Human-readable list of metrics that got worse by more than max_regression percent."""
+    found, changes = [], []
+    old, new = previous["latency"], result["latency"]
+    if old.get("count") and new.get("count"):
+        change = 100 * (new["p95"] / old["p95"] - 1)
+        changes.append(f"p95 latency {change:+.1f}%")
+        if change > max_regression:
+            found.append(f"p95 latency {old['p95']:.2f}s -> {new['p95']:.2f}s")
+    if previous["detection_fps"]:
+        change = 100 * (result["detection_fps"] / previous["detection_fps"] - 1)
+        changes.append(f"detection fps {change:+.1f}%")
+        if -change > max_regression:
+            found.append(f"detection fps {previous['detection_fps']:.1f} -> {result['detection_fps']:.1f}")
+    if result["missing"] > previous.get("missing", 0):
+        found.append(f"{result['missing']} event(s) never reached the dashboard")
+    print(f"vs previous ({previous.get('commit')}): " + ", ".join(changes))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=os.path.join(ROOT, "videos", "1.mp4"))
+    parser.add_argument("--audio", default=None, help="16-bit WAV replayed instead of the microphone")
+    parser.add_argument("--model", default="model_quantized.onnx")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed (2 = twice real time)")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="loop the video for this many seconds (default: play it once)")
+    parser.add_argument("--workers", type=int, default=None, help="inference workers")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--motion-area-threshold", type=int, default=None)
+    parser.add_argument("--poll", type=float, default=0.25, help="dashboard poll interval (s)")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--output", default="bench_replay.json")
+    parser.add_argument("--compare", default=None, help="previous JSON result to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=20, help="allowed regression in %%")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary folder")
+    args = parser.parse_args()
+    # The run changes into its temporary folder; resolve paths first
+    for name in ("video", "audio", "model", "output"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    try:
+        result = run(args, workdir)
+    finally:
+        os.chdir(ROOT)
+        if args.keep:
+            print(f"Run folder kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "machine": platform.machine(), "cpu_count": os.cpu_count(),
+              "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")},
+              **result}
+    print_report(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        found = regressions(report, previous, args.max_regression)
+        if found:
+            print("Regressions:\n  " + "\n  ".join(found))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures inference start-up cost on the Pi: import time, session creation
+(cold = optimizes the graph and writes <model>.opt.onnx, warm = loads the cached graph),
+first-inference latency and peak RSS.
+
+Usage:
+    python benchmarks/bench_startup.py --model model_quantized.onnx
+    python benchmarks/bench_startup.py --model model_quantized.onnx --clip videos/1.mp4
+
+Each measurement runs in a fresh interpreter so module caches don't hide import cost.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = r"""
+import sys, time, json, resource
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import inference
+t1 = time.perf_counter()
+session = inference.get_session({model!r})
+t2 = time.perf_counter()
+if {clip!r}:
+    inference.predict({clip!r}, model_path={model!r})
+else:
+    import numpy as np
+    inp = session.get_inputs()[0]
+    shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+    session.run(None, {{inp.name: np.random.default_rng(0).standard_normal(shape, dtype=np.float32)}})
+t3 = time.perf_counter()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+print(json.dumps({{"import": t1 - t0, "session": t2 - t1, "first": t3 - t2,
+                  "torch": "torch" in sys.modules, "rss_mb": rss_kb / 1024}}))
+"""
+
+def measure(model, clip):
+    code = CHILD.format(root=ROOT, model=model, clip=clip)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="model_quantized.onnx")
+    parser.add_argument("--clip", default="", help="real clip for the first inference (default: random input)")
+    args = parser.parse_args()
+
+    model = os.path.abspath(args.model)
+    cached = os.path.splitext(model)[0] + ".opt.onnx"
+    if os.path.exists(cached):
+        os.remove(cached)
+
+    print(f"{'run':>6} {'import s':>9} {'session s':>10} {'first run s':>12} {'peak RSS MB':>12} {'torch':>6}")
+    for name in ("cold", "warm"):
+        r = measure(model, args.clip)
+        print(f"{name:>6} {r['import']:>9.3f} {r['session']:>10.3f} {r['first']:>12.3f} {r['rss_mb']:>12.1f} {str(r['torch']):>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Runs one detection loop per camera, each in its own process, feeding one RecorderModule.
+
+Usage:
+    python camera_manager.py cameras.json
+    python camera_manager.py --source videos/1.mp4 --source videos/1.mp4   # looping files as cameras
+
+cameras.json is a list of camera settings (any key of sensor_input.camera_settings, plus
+an optional per-camera "max_storage_gb"):
+    [
+        {"name": "door", "source": "/dev/video0", "audio_device_index": 1},
+        {"name": "yard", "source": "rtsp://192.168.1.20/stream", "audio": false,
+         "motion_area_threshold": 12000, "output_dir": "/home/admin/pi/recordings/yard"}
+    ]
+"""
+import os
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import multiprocessing as mp
+
+import psutil
+
+import metrics
+from capture_pipeline import is_file_source, parse_source
+
+logger = logging.getLogger(__name__)
+
+CAMERA_ROOT = "/home/admin/pi/recordings"   # Default output folder is CAMERA_ROOT/<name>
+INFERENCE_RESERVED_CORES = 1    # Cores kept free for inference; the recorder's model threads are capped to match
+WORKER_NICE = 5                 # Detection processes yield to the recorder/inference process
+CPU_HIGH = 85                   # % CPU at which detection is throttled while clips are queued...
+CPU_LOW = 60                    # ...and un-throttled once it falls under this
+THROTTLED_DETECTION_FPS = 5     # Motion checks per second while throttled
+MONITOR_INTERVAL = 2            # seconds between CPU / queue checks
+HEALTH_REPORT_INTERVAL = 10     # seconds between per-camera health reports
+METRICS_REPORT_INTERVAL = 5     # seconds between per-camera metrics snapshots
+RESTART_DELAY = 10              # seconds before a crashed camera process is restarted
+
+
+def max_cameras(reserved=INFERENCE_RESERVED_CORES):
+    """How many detection processes fit next to inference on this machine."""
+    return max(1, (os.cpu_count() or 1) - reserved)
+
+def camera_config(camera, index, default_mic_taken=False):
+    """
+    Fills in the name, output folder, audio and file-source defaults of one configured camera.
+    default_mic_taken says an earlier camera already uses the default audio device.
+    """
+    camera = dict(camera)
+    camera.setdefault("name", f"cam{index}")
+    camera.setdefault("output_dir", os.path.join(CAMERA_ROOT, camera["name"]))
+    source = parse_source(camera.get("source", 0))
+    if is_file_source(source):
+        # A file stands in for a camera: loop it and don't open a microphone for it
+        camera.setdefault("loop", True)
+        camera.setdefault("audio", False)
+    elif default_mic_taken and "audio_device_index" not in camera:
+        # Only one process can open the default microphone; later cameras without
+        # their own audio_device_index run on motion alone
+        camera.setdefault("audio", False)
+    return camera
+
+def check_audio_devices(cameras):
+    """
+    Raises ValueError if two cameras (resolved sensor_input.camera_settings) would open the
+    same audio input device; the second one would fail to start and be restarted forever.
+    """
+    owners = {}
+    for settings in cameras:
+        if not settings["audio"] or settings["audio_file"]:
+            continue
+        device = settings["audio_device_index"]
+        if device in owners:
+            label = "the default device" if device is None else f"device {device}"
+            raise ValueError(f"Cameras {owners[device]} and {settings['name']} both use audio from {label}; "
+                             f"give each camera its own audio_device_index or set \"audio\": false")
+        owners[device] = settings["name"]
+
+
+def run_camera(camera, events, backlogged, detection_interval):
+    """
+    Entry point of a camera process. Runs sensor_input.main with this camera's settings;
+    backpressure, throttling and space requests go through the shared objects.
+    """
+    try:
+        os.nice(WORKER_NICE)
+    except (AttributeError, OSError):
+        pass
+    import sensor_input
+    from health_monitor import get_health_monitor
+
+    name = camera["name"]
+
+    def report_health():
+        monitor = get_health_monitor(sensor_input.frame_queue)
+        while True:
+            time.sleep(HEALTH_REPORT_INTERVAL)
+            events.put(("health", name, monitor.video_warnings()))
+
+    def report_metrics():
+        # Detection and trigger metrics live in this process's registry; the recorder
+        # merges them into its own, so they show up on its /metrics endpoint
+        pid = os.getpid()
+        while True:
+            time.sleep(METRICS_REPORT_INTERVAL)
+            events.put(("metrics", name, pid, metrics.snapshot()))
+
+    threading.Thread(target=report_health, name="health-report", daemon=True).start()
+    threading.Thread(target=report_metrics, name="metrics-report", daemon=True).start()
+    sensor_input.main(
+        camera=camera,
+        is_backlogged=backlogged.is_set,
+        detection_interval=lambda: detection_interval.value,
+        # The recorder process owns the retention index; ask it to make room
+        reserve_space=lambda output_dir: events.put(("space", name, output_dir)),
+    )
+
+
+class CameraManager:
+    """
+    Starts a detection process per camera (spawned, so each gets its own interpreter,
+    camera handle and module state, and the loops scale across cores). Each camera writes
+    to its own folder, which the recorder watches, so every clip ends up in the recorder's
+    shared work queue.
+
+    CPU-aware admission: only max_cameras(recorder.inference_cores) cameras are started
+    (main() builds the recorder with inference_cores=INFERENCE_RESERVED_CORES, so inference
+    uses exactly the cores the cameras leave free), detection processes run
+    at a lower priority than inference, and while the CPU is saturated with clips queued,
+    motion checks drop to THROTTLED_DETECTION_FPS. The recorder's backlog flag is mirrored
+    to every camera, so they all stop starting motion-only clips together.
+    """
+
+    def __init__(self, recorder, cameras, reserved_cores=None):
+        self.recorder = recorder
+        configured, default_mic_taken = [], False
+        for i, camera in enumerate(cameras):
+            camera = camera_config(camera, i, default_mic_taken)
+            if camera.get("audio", True) and not camera.get("audio_file") and "audio_device_index" not in camera:
+                default_mic_taken = True
+            configured.append(camera)
+        cameras = configured
+        limit = max_cameras(reserved_cores or recorder.inference_cores)
+        if len(cameras) > limit:
+            skipped = ", ".join(c["name"] for c in cameras[limit:])
+            logger.warning(f"[Cameras] {len(cameras)} configured but only {limit} fit next to inference "
+                           f"on {os.cpu_count()} cores; not starting: {skipped}")
+        self.cameras = {c["name"]: c for c in cameras[:limit]}
+        self.ctx = mp.get_context("spawn")
+        self.events = self.ctx.Queue()
+        self.backlogged = self.ctx.Event()
+        self.detection_interval = self.ctx.Value("d", 0.0)
+        self.processes = {}
+        self.exited = {}
+        self.health = {}
+        self.metric_snapshots = {}  # (name, pid) -> last merged snapshot from that process
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        import sensor_input
+        self.recorder.health.analyse_frames = False  # video health comes from the camera processes
+        self.recorder.warning_sources.append(self.video_warnings)
+        storage = {name: camera.pop("max_storage_gb", None) for name, camera in self.cameras.items()}
+        # Fail fast on a typo or a shared microphone in the config, before any process starts
+        check_audio_devices([sensor_input.camera_settings(camera) for camera in self.cameras.values()])
+        for name, camera in self.cameras.items():
+            self.recorder.add_source(camera["output_dir"], storage[name])
+            self._spawn(name)
+        self.running = True
+        psutil.cpu_percent(interval=None)
+        threading.Thread(target=self._event_loop, name="camera-events", daemon=True).start()
+        threading.Thread(target=self._monitor_loop, name="camera-monitor", daemon=True).start()
+
+    def _spawn(self, name):
+        process = self.ctx.Process(target=run_camera, name=f"camera-{name}", daemon=True,
+                                   args=(self.cameras[name], self.events, self.backlogged, self.detection_interval))
+        process.start()
+        self.processes[name] = process
+        logger.info(f"[Cameras] Started {name} ({self.cameras[name]['source']}) as pid {process.pid}")
+
+    def stop(self):
+        self.running = False
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=5)
+
+    def _event_loop(self):
+        import sensor_input
+        while self.running:
+            try:
+                event = self.events.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                kind, name = event[0], event[1]
+                if kind == "space":
+                    sensor_input.ensure_space(event[2])  # same retention manager the recorder uses
+                elif kind == "health":
+                    self._update_health(name, event[2])
+                elif kind == "metrics":
+                    self._merge_metrics(name, event[2], event[3])
+            except Exception as e:
+                logger.error(f"[Cameras] Failed to handle {event!r}: {e}")
+
+    def _update_health(self, name, warnings):
+        with self.lock:
+            self.health[name] = [f"[{name}] {w}" for w in warnings]
+
+    def _merge_metrics(self, name, pid, snapshot):
+        # Keyed by pid: a restarted camera starts from zero, and a late snapshot from
+        # the old process is still merged against that process's own previous one
+        key = (name, pid)
+        metrics.merge(snapshot, self.metric_snapshots.get(key))
+        self.metric_snapshots[key] = snapshot
+
+    def video_warnings(self):
+        """Latest camera warnings from every process; the recorder logs them with its own."""
+        with self.lock:
+            return [w for warnings in self.health.values() for w in warnings]
+
+    def _monitor_loop(self):
+        throttled = False
+        while self.running:
+            time.sleep(MONITOR_INTERVAL)
+            if self.recorder.is_backlogged():
+                self.backlogged.set()
+            else:
+                self.backlogged.clear()
+
+            cpu = psutil.cpu_percent(interval=None)
+            queued = self.recorder.work_queue.depth() > 0
+            if not throttled and cpu > CPU_HIGH and queued:
+                throttled = True
+                self.detection_interval.value = 1.0 / THROTTLED_DETECTION_FPS
+                logger.warning(f"[Cameras] CPU at {cpu:.0f}% with clips queued: throttling detection "
+                               f"to {THROTTLED_DETECTION_FPS} fps per camera.")
+            elif throttled and (cpu < CPU_LOW or not queued):
+                throttled = False
+                self.detection_interval.value = 0.0
+                logger.info(f"[Cameras] CPU at {cpu:.0f}%: detection back to full rate.")
+
+            for name, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                # Restart crashed cameras (e.g. a USB camera that was unplugged), at most every RESTART_DELAY
+                exited = self.exited.setdefault(name, time.monotonic())
+                if time.monotonic() - exited >= RESTART_DELAY:
+                    logger.warning(f"[Cameras] {name} exited with code {process.exitcode}; restarting.")
+                    del self.exited[name]
+                    self._spawn(name)
+
+    def stats(self):
+        return {name: {"pid": p.pid, "alive": p.is_alive(), "source": self.cameras[name]["source"]}
+                for name, p in self.processes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", nargs="?", help="JSON list of camera settings")
+    parser.add_argument("--source", action="append", default=[],
+                        help="camera index, /dev/videoN, video file or URL (repeatable; instead of a config)")
+    parser.add_argument("--workers", type=int, default=None, help="inference workers (default: recorder default)")
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config) as f:
+            cameras = json.load(f)
+    elif args.source:
+        cameras = [{"source": source} for source in args.source]
+    else:
+        parser.error("give a config file or at least one --source")
+
+    from recorder_module import RecorderModule
+    kwargs = {"inference_workers": args.workers} if args.workers else {}
+    recorder = RecorderModule(inference_cores=INFERENCE_RESERVED_CORES, **kwargs)
+    manager = CameraManager(recorder, cameras)
+    manager.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        manager.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+import time
+import wave
+import queue
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+import cv2
+
+from metrics import histogram, observe_since_trigger
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# DEFAULTS
+# -----------------------------
+PRE_ROLL_SECONDS = 5      # Seconds of footage kept in memory before a trigger
+POST_ROLL_SECONDS = 10    # Seconds recorded after the last trigger
+MAX_CLIP_SECONDS = 30     # Re-triggers extend a clip up to this length
+JPEG_QUALITY = 80         # Quality of the in-memory encoded frames
+
+
+def parse_source(source):
+    """
+    Normalises a capture source: an int or digit string is a camera index, anything else
+    (/dev/videoN, a file path, an rtsp:// or http:// URL) is passed to cv2 as a string.
+    """
+    if isinstance(source, int):
+        return source
+    source = str(source)
+    return int(source) if source.isdigit() else source
+
+def is_file_source(source):
+    return isinstance(source, str) and os.path.isfile(source)
+
+
+class ClipWriter(threading.Thread):
+    """
+    Encodes one clip in the background. Pre-roll frames and audio are handed over
+    up front, live frames and audio are pushed while the clip is open, and the
+    final MP4 (H.264 + AAC) is written once the post-roll deadline has passed.
+    """
+
+    def __init__(self, filename, fps, end_time, max_end_time, frames, audio, audio_rate, audio_channels):
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.fps = fps
+        self.end_time = end_time
+        self.max_end_time = max_end_time
+        self.audio_rate = audio_rate
+        self.audio_channels = audio_channels
+        self.frame_queue = queue.Queue()
+        self.closed_at = None
+        self.audio_chunks = list(audio)
+        self.lock = threading.Lock()
+        for frame in frames:
+            self.frame_queue.put(frame)
+
+    def extend(self, end_time):
+        """Push the post-roll deadline out, capped at the maximum clip length."""
+        with self.lock:
+            self.end_time = min(max(self.end_time, end_time), self.max_end_time)
+
+    def is_open(self, timestamp):
+        with self.lock:
+            return timestamp <= self.end_time
+
+    def push_frame(self, jpeg):
+        self.frame_queue.put(jpeg)
+
+    def push_audio(self, chunk):
+        self.audio_chunks.append(chunk)
+
+    def close(self):
+        self.closed_at = time.perf_counter()
+        self.frame_queue.put(None)
+
+    def run(self):
+        tmp_dir = tempfile.mkdtemp(prefix="clip_")
+        video_path = os.path.join(tmp_dir, "video.mp4")
+        audio_path = os.path.join(tmp_dir, "audio.wav")
+        try:
+            self._encode_video(video_path)
+            if self.audio_chunks:
+                self._write_wav(audio_path)
+                self._mux(video_path, audio_path)
+            else:
+                self._mux(video_path, None)
+            if self.closed_at is not None:
+                # Time from the end of the post-roll until the MP4 is on disk
+                histogram("recording_finalize_seconds", "ffmpeg encode/mux after the post-roll ends").observe(
+                    time.perf_counter() - self.closed_at)
+            observe_since_trigger("trigger_to_clip_seconds", self.filename, "Trigger until the clip is written")
+            logger.info(f"[Capture] Saved recording: {self.filename}")
+        except Exception as e:
+            logger.error(f"[Capture] Failed to write {self.filename}: {e}")
+        finally:
+            for path in (video_path, audio_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            os.rmdir(tmp_dir)
+
+    def _encode_video(self, video_path):
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "image2pipe",
+            "-c:v", "mjpeg",
+            "-framerate", str(self.fps),
+            "-i", "pipe:0",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-pix_fmt", "yuv420p",
+            video_path
+        ]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            while True:
+                jpeg = self.frame_queue.get()
+                if jpeg is None:
+                    break
+                proc.stdin.write(jpeg)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+    def _write_wav(self, audio_path):
+        with wave.open(audio_path, "wb") as wf:
+            wf.setnchannels(self.audio_channels)
+            wf.setsampwidth(2)  # paInt16
+            wf.setframerate(self.audio_rate)
+            wf.writeframes(b"".join(self.audio_chunks))
+
+    def _mux(self, video_path, audio_path):
+        # The final file is written directly into the output directory so the
+        # recorder's watchdog sees a single close event for a complete clip.
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", video_path]
+        if audio_path:
+            cmd += ["-i", audio_path, "-c:a", "aac", "-b:a", "128k", "-shortest"]
+        cmd += ["-c:v", "copy", "-movflags", "+faststart", self.filename]
+        subprocess.run(cmd, check=False)
+
+
+class CapturePipeline:
+    """
+    Owns the camera for the lifetime of the process. A single reader thread decodes
+    each frame once and fans it out to the motion detector (latest raw frame), the
+    JPEG pre-roll ring buffer and, while a clip is open, the active ClipWriter.
+
+    device may also be a video file or stream URL. A file is played back at speed x its
+    own frame rate (not as fast as it decodes), and with loop=True it restarts at the end,
+    so a looping MP4 can stand in for a camera.
+    """
+
+    def __init__(self, device=0, width=640, height=480, fps=30,
+                 pre_roll_seconds=PRE_ROLL_SECONDS, jpeg_quality=JPEG_QUALITY,
+                 audio_rate=48000, audio_channels=1, loop=False, speed=1.0):
+        self.device = parse_source(device)
+        self.from_file = is_file_source(self.device)
+        self.loop = loop
+        self.speed = speed
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pre_roll_seconds = pre_roll_seconds
+        self.jpeg_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        self.audio_rate = audio_rate
+        self.audio_channels = audio_channels
+
+        self.frame_ring = deque(maxlen=max(1, int(pre_roll_seconds * fps)))
+        self.audio_ring = deque()
+        self.audio_ring_bytes = 0
+        self.audio_ring_limit = int(pre_roll_seconds * audio_rate * audio_channels * 2)
+
+        self.cap = None
+        self.writer = None
+        self.latest_frame = None
+        self.frame_seq = 0
+        self.running = False
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.thread = None
+
+    def start(self):
+        self.cap = cv2.VideoCapture(self.device)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        if not self.cap.isOpened():
+            return False
+        if self.from_file:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or self.fps
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            self.new_frame.notify_all()
+        if self.cap is not None:
+            self.cap.release()
+
+    def _capture_loop(self):
+        frame_interval = 1.0 / (self.fps * self.speed)
+        next_frame_time = time.monotonic()
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret and self.from_file and self.loop:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.cap.read()
+            if not ret:
+                logger.error("[Capture] Camera frame not available, stopping capture.")
+                break
+            if self.from_file:
+                # Cameras deliver frames in real time; pace file playback the same way
+                next_frame_time += frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
+            now = time.time()
+            ok, jpeg = cv2.imencode(".jpg", frame, self.jpeg_params)
+            jpeg = jpeg.tobytes() if ok else None
+            with self.lock:
+                if jpeg is not None:
+                    self.frame_ring.append(jpeg)
+                    if self.writer is not None:
+                        if self.writer.is_open(now):
+                            self.writer.push_frame(jpeg)
+                        else:
+                            self.writer.close()
+                            self.writer = None
+                self.latest_frame = frame
+                self.frame_seq += 1
+                self.new_frame.notify_all()
+        with self.lock:
+            self.running = False
+            self.new_frame.notify_all()
+
+    def read(self, last_seq=0, timeout=1.0):
+        """
+        Waits for a frame newer than last_seq.
+        Returns (ret, frame, seq) like cv2.VideoCapture.read plus the frame sequence number.
+        """
+        with self.lock:
+            if self.frame_seq <= last_seq and self.running:
+                self.new_frame.wait(timeout)
+            if self.frame_seq <= last_seq:
+                return False, None, last_seq
+            return True, self.latest_frame, self.frame_seq
+
+    def push_audio(self, chunk):
+        """Adds raw 16-bit PCM to the audio pre-roll and to the open clip."""
+        with self.lock:
+            self.audio_ring.append(chunk)
+            self.audio_ring_bytes += len(chunk)
+            while self.audio_ring_bytes > self.audio_ring_limit and len(self.audio_ring) > 1:
+                self.audio_ring_bytes -= len(self.audio_ring.popleft())
+            if self.writer is not None:
+                self.writer.push_audio(chunk)
+
+    def is_recording(self):
+        with self.lock:
+            return self.writer is not None
+
+    def trigger(self, filename, post_roll_seconds=POST_ROLL_SECONDS, max_clip_seconds=MAX_CLIP_SECONDS):
+        """
+        Starts a clip containing the pre-roll plus post_roll_seconds of live footage.
+        If a clip is already open its deadline is extended instead.
+        Returns True when a new clip was started.
+        """
+        now = time.time()
+        with self.lock:
+            if self.writer is not None:
+                self.writer.extend(now + post_roll_seconds)
+                return False
+            self.writer = ClipWriter(
+                filename, self.fps,
+                end_time=now + post_roll_seconds,
+                max_end_time=now + max_clip_seconds - self.pre_roll_seconds,
+                frames=list(self.frame_ring),
+                audio=list(self.audio_ring),
+                audio_rate=self.audio_rate,
+                audio_channels=self.audio_channels
+            )
+            self.writer.start()
+            return True
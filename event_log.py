@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+# Defaults for every append-only log on the Pi
+MAX_LOG_BYTES = 5 * 1024 * 1024  # Rotate the active file at this size
+LOG_BACKUP_COUNT = 5             # Keep path.1 .. path.N rotated files
+FSYNC_EVERY = 20                 # fsync after this many events ...
+FSYNC_INTERVAL = 1.0             # ... or this many seconds after the first unsynced event
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+class EventLog:
+    """
+    Append-only JSON Lines log.
+
+    Each event is one line, so appending is O(1) and a crash can at most leave a torn
+    last line (which the readers skip) instead of corrupting the whole history.
+    Writes are flushed immediately and fsync'd in batches; the active file is rotated
+    to path.1, path.2, ... once it reaches max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=MAX_LOG_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.unsynced = 0
+        self.timer = None
+
+    def _open(self):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, event):
+        """Appends one event (a JSON-serialisable dict) and returns it."""
+        line = json.dumps(event, default=str) + "\n"
+        with self.lock:
+            self._open()
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self._sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.fsync_interval, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+        return event
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.file is not None and self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def _rotate(self):
+        self._sync()
+        self.file.close()
+        self.file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    # -----------------------------
+    # TYPED WRITERS
+    # -----------------------------
+    def write_inference(self, file_path, result, **extra):
+        """Inference result for one clip (same keys as the per-video JSON on the dashboard)."""
+        entry = {"Timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "File": str(file_path), "Result": result}
+        entry.update(extra)
+        return self.append(entry)
+
+    def write_warnings(self, warnings, **extra):
+        """A list of camera/system warning strings."""
+        entry = {"Timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "Warnings": list(warnings)}
+        entry.update(extra)
+        return self.append(entry)
+
+
+def get_event_log(path, **kwargs):
+    """Returns the process-wide EventLog for path so every writer shares one file handle."""
+    path = os.path.abspath(str(path))
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = EventLog(path, **kwargs)
+        return log
+
+
+@atexit.register
+def _close_all():
+    with _logs_lock:
+        for log in _logs.values():
+            log.close()
+
+
+# -----------------------------
+# READERS
+# -----------------------------
+def _log_files(path, include_rotated):
+    """Oldest first: path.N, ..., path.1, path."""
+    files = []
+    if include_rotated:
+        i = 1
+        while os.path.exists(f"{path}.{i}"):
+            files.append(f"{path}.{i}")
+            i += 1
+        files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+def _parse(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None  # torn line from an interrupted write
+
+def read_events(path, include_rotated=True):
+    """Streams events oldest to newest without loading the whole history."""
+    for log_file in _log_files(str(path), include_rotated):
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                event = _parse(line)
+                if event is not None:
+                    yield event
+
+def _reverse_lines(log_file, block_size=8192):
+    """Yields the lines of a file last to first, reading fixed-size blocks from the end."""
+    with open(log_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        remainder = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace")
+        if remainder:
+            yield remainder.decode("utf-8", errors="replace")
+
+def tail_events(path, n=10, include_rotated=True):
+    """Returns the last n events (oldest first), reading only the end of the log."""
+    events = []
+    for log_file in reversed(_log_files(str(path), include_rotated)):
+        for line in _reverse_lines(log_file):
+            event = _parse(line)
+            if event is not None:
+                events.append(event)
+                if len(events) >= n:
+                    return events[::-1]
+    return events[::-1]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Print the last entries of a JSON Lines event log.")
+    parser.add_argument("path")
+    parser.add_argument("-n", type=int, default=10)
+    args = parser.parse_args()
+    for event in tail_events(args.path, args.n):
+        print(json.dumps(event))
@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+
+# ImageNet normalisation used when the model was trained
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+INPUT_SIZE = 224
+
+# x_norm = (x / 255 - mean) / std  ==  x * SCALE - OFFSET
+SCALE = (1.0 / (255.0 * STD)).reshape(1, 3, 1, 1)
+OFFSET = (MEAN / STD).reshape(1, 3, 1, 1)
+
+def frame_indices(total_frames, num_frames=5):
+    """Evenly spaced frame indices, matching the sampling used during training."""
+    return np.linspace(0, total_frames - 1, num_frames, dtype=int)
+
+def sample_frames(video_path, num_frames=5):
+    """
+    Decodes the clip in a single forward pass and returns the sampled BGR frames.
+    Frames that are not needed are only grabbed (demuxed/decoded without the colour
+    conversion and copy), so no seeking back to keyframes is ever required.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frames = []
+        pos = -1
+        frame = None
+        for idx in frame_indices(total_frames, num_frames):
+            while pos < idx:
+                if not cap.grab():
+                    raise ValueError(f"Failed to read frame {idx} from {video_path}")
+                pos += 1
+                frame = None
+            if frame is None:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    raise ValueError(f"Failed to read frame {idx} from {video_path}")
+            frames.append(frame)
+        return frames
+    finally:
+        cap.release()
+
+def resize_frames(frames, size=INPUT_SIZE, out=None):
+    """Resizes BGR frames into a (N, size, size, 3) uint8 RGB stack."""
+    if out is None:
+        out = np.empty((len(frames), size, size, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        cv2.resize(frame, (size, size), dst=out[i], interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(out[i], cv2.COLOR_BGR2RGB, dst=out[i])
+    return out
+
+def normalize_frames(stack, out=None):
+    """
+    Converts a (N, H, W, 3) uint8 RGB stack into the (1, N, 3, H, W) float32 model input
+    with one vectorised multiply-add, writing into out when given.
+    """
+    n, h, w, _ = stack.shape
+    if out is None:
+        out = np.empty((1, n, 3, h, w), dtype=np.float32)
+    chw = out[0]
+    np.copyto(chw, stack.transpose(0, 3, 1, 2), casting="unsafe")
+    chw *= SCALE
+    chw -= OFFSET
+    return out
+
+def preprocess_frames(frames, size=INPUT_SIZE, out=None):
+    """Resize + normalise a list of BGR frames into a single model input tensor."""
+    return normalize_frames(resize_frames(frames, size), out=out)
+
+
+# -----------------------------
+# STREAMING (sliding windows)
+# -----------------------------
+def video_info(video_path):
+    """(fps, total_frames) from the container header."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open {video_path}")
+        return cap.get(cv2.CAP_PROP_FPS) or 30.0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+def iter_frames(video_path, step=1, start=0):
+    """
+    Yields (frame_index, BGR frame) for every step-th frame from start, in one forward
+    decode pass. Skipped frames are only grabbed, never converted or copied.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        pos = -1
+        target = start
+        while cap.grab():
+            pos += 1
+            if pos < target:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield pos, frame
+            target += step
+    finally:
+        cap.release()
+
+
+class FrameRing:
+    """
+    The last `capacity` preprocessed frames as (3, size, size) float32 slots. Each decoded
+    frame is resized and normalised once, straight into its slot, so overlapping windows
+    share frames instead of decoding or normalising them again. window() copies the
+    newest `n` frames, oldest first, into the model input layout.
+    """
+
+    def __init__(self, capacity, size=INPUT_SIZE):
+        self.capacity = capacity
+        self.size = size
+        self.frames = np.empty((capacity, 3, size, size), dtype=np.float32)
+        self.indices = np.full(capacity, -1, dtype=np.int64)  # source frame index per slot
+        self.resized = np.empty((1, size, size, 3), dtype=np.uint8)
+        self.count = 0  # frames ever pushed
+
+    def push(self, frame, frame_index):
+        slot = self.count % self.capacity
+        resize_frames([frame], self.size, out=self.resized)
+        normalize_frames(self.resized, out=self.frames[slot:slot + 1][None])
+        self.indices[slot] = frame_index
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def window(self, n, out=None):
+        """Returns (tensor (1, n, 3, size, size), first_frame_index, last_frame_index)."""
+        if n > len(self):
+            raise ValueError(f"only {len(self)} frame(s) buffered, {n} requested")
+        if out is None:
+            out = np.empty((1, n, 3, self.size, self.size), dtype=np.float32)
+        slots = [(self.count - n + i) % self.capacity for i in range(n)]
+        np.take(self.frames, slots, axis=0, out=out[0])
+        return out, int(self.indices[slots[0]]), int(self.indices[slots[-1]])
@@ -0,0 +1,209 @@
+import time
+import queue
+import threading
+import cv2
+import numpy as np
+import psutil
+
+# Video thresholds (same as alerts.py, measured on the downsampled frame)
+LOW_BRIGHTNESS_THRESHOLD = 40
+LOW_CONTRAST_THRESHOLD = 15
+HIGH_NOISE_THRESHOLD = 8    # std of the high-pass residual (grey levels)
+BLUR_THRESHOLD = 80         # Laplacian variance at HEALTH_FRAME_SIZE
+BLACK_LEVEL = 10
+# System thresholds
+HIGH_CPU_USAGE = 75
+HIGH_TEMP_THRESHOLD = 65  # °C
+HIGH_RAM_USAGE = 85
+HIGH_DISK_USAGE = 85
+
+HEALTH_SAMPLE_HZ = 1.0          # Frames analysed per second
+HEALTH_FRAME_SIZE = (160, 120)  # Analysis resolution
+HEALTH_EMA_ALPHA = 0.2          # Weight of the newest sample in the moving averages
+SYSTEM_SAMPLE_INTERVAL = 5      # seconds between psutil samples
+STALE_FRAME_SECONDS = 10        # No frame for this long -> camera warning
+TEMP_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+def frame_stats(small_gray):
+    """Brightness, contrast, noise and blur of one downsampled greyscale frame."""
+    gray = small_gray.astype(np.float32)
+    brightness = float(gray.mean())
+    contrast = float(gray.std())
+    # Noise: what is left after a 3x3 blur removes the image content
+    noise = float((gray - cv2.blur(gray, (3, 3))).std())
+    blur = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    return {"brightness": brightness, "contrast": contrast, "noise": noise, "blur": blur,
+            "black": bool(small_gray.max() < BLACK_LEVEL)}
+
+def read_cpu_temp():
+    try:
+        with open(TEMP_PATH) as f:
+            return int(f.read().strip()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+class HealthMonitor:
+    """
+    Camera and system health from the frames the detection loop already captured.
+
+    The sensor loop offers frames to frame_queue (non-blocking, dropped when full), so the
+    camera is never opened a second time. A background thread analyses at most
+    HEALTH_SAMPLE_HZ frames per second on a HEALTH_FRAME_SIZE greyscale copy and keeps
+    exponential moving averages, so one dark or shaky frame does not raise a warning.
+    System metrics come from non-blocking psutil calls. snapshot() returns the latest state
+    without doing any work.
+    """
+
+    def __init__(self, frame_queue, sample_hz=HEALTH_SAMPLE_HZ, frame_size=HEALTH_FRAME_SIZE,
+                 alpha=HEALTH_EMA_ALPHA, system_interval=SYSTEM_SAMPLE_INTERVAL, disk_path="/"):
+        self.frame_queue = frame_queue
+        self.sample_interval = 1.0 / sample_hz
+        self.frame_size = frame_size
+        self.alpha = alpha
+        self.system_interval = system_interval
+        self.disk_path = disk_path
+        self.lock = threading.Lock()
+        self.video = {}
+        self.system = {}
+        self.frames_analysed = 0
+        self.last_frame_time = None
+        self.started = time.time()
+        self.running = False
+        self.thread = None
+        # False when this process receives no frames (cameras run in camera_manager workers)
+        self.analyse_frames = True
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        psutil.cpu_percent(interval=None)  # prime: the next call reports usage since now
+        self.thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def offer(self, frame):
+        """Called by the producer; never blocks and drops the frame if the monitor is behind."""
+        try:
+            self.frame_queue.put_nowait(frame)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        next_system = 0.0
+        while self.running:
+            now = time.monotonic()
+            if now >= next_system:
+                self._sample_system()
+                next_system = now + self.system_interval
+            try:
+                frame = self.frame_queue.get(timeout=self.sample_interval)
+            except queue.Empty:
+                continue
+            # Only the newest frame matters
+            while True:
+                try:
+                    frame = self.frame_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._sample_frame(frame)
+            time.sleep(max(0.0, self.sample_interval - (time.monotonic() - now)))
+
+    def _sample_frame(self, frame):
+        small = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        stats = frame_stats(small)
+        with self.lock:
+            for name in ("brightness", "contrast", "noise", "blur"):
+                previous = self.video.get(name)
+                value = stats[name]
+                self.video[name] = value if previous is None else self.alpha * value + (1 - self.alpha) * previous
+            self.video["black"] = stats["black"]
+            self.frames_analysed += 1
+            self.last_frame_time = time.time()
+
+    def _sample_system(self):
+        system = {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "cpu_temp": read_cpu_temp(),
+            "ram_percent": psutil.virtual_memory().percent,
+            "disk_percent": psutil.disk_usage(self.disk_path).percent,
+        }
+        with self.lock:
+            self.system = system
+
+    def video_warnings(self):
+        if not self.analyse_frames:
+            return []
+        with self.lock:
+            video = dict(self.video)
+            last = self.last_frame_time
+        reference = last if last is not None else self.started
+        if time.time() - reference > STALE_FRAME_SECONDS:
+            return ["Camera frame not available"]
+        if not video:
+            return []
+        warnings = []
+        if video["brightness"] < LOW_BRIGHTNESS_THRESHOLD:
+            warnings.append("Low brightness detected")
+        if video["contrast"] < LOW_CONTRAST_THRESHOLD:
+            warnings.append("Low contrast detected")
+        if video["noise"] > HIGH_NOISE_THRESHOLD:
+            warnings.append("High noise detected")
+        if video["black"]:
+            warnings.append("Camera might be obstructed or turned off")
+        if video["blur"] < BLUR_THRESHOLD:
+            warnings.append("Blurry video detected")
+        return warnings
+
+    def system_warnings(self):
+        with self.lock:
+            system = dict(self.system)
+        if not system:
+            return []
+        warnings = []
+        if system["cpu_percent"] > HIGH_CPU_USAGE:
+            warnings.append(f"High CPU usage: {system['cpu_percent']}%")
+        if system["cpu_temp"] is None:
+            warnings.append("CPU temperature monitoring not available")
+        elif system["cpu_temp"] > HIGH_TEMP_THRESHOLD:
+            warnings.append(f"High CPU temperature: {system['cpu_temp']:.1f}°C")
+        if system["ram_percent"] > HIGH_RAM_USAGE:
+            warnings.append(f"High RAM usage: {system['ram_percent']}%")
+        if system["disk_percent"] > HIGH_DISK_USAGE:
+            warnings.append(f"High disk usage: {system['disk_percent']}%")
+        return warnings
+
+    def snapshot(self):
+        """Current health as a plain dict; cheap enough to call from any thread."""
+        video_warnings = self.video_warnings()
+        system_warnings = self.system_warnings()
+        with self.lock:
+            return {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "video": {k: round(v, 2) if isinstance(v, float) else v for k, v in self.video.items()},
+                "system": dict(self.system),
+                "frames_analysed": self.frames_analysed,
+                "video_warnings": video_warnings,
+                "system_warnings": system_warnings,
+                "warnings": video_warnings + system_warnings,
+            }
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_health_monitor(frame_queue=None):
+    """Returns the process-wide HealthMonitor, creating it on first use."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = HealthMonitor(frame_queue if frame_queue is not None else queue.Queue(maxsize=2))
+        return _monitor
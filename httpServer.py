@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, send_file, Response
 from datetime import datetime
 import os
-import subprocess
+import time
 import logging
 import json
+from video_catalog import VideoCatalog, DEFAULT_PAGE_SIZE
+from thumbnailer import Thumbnailer, thumbnail_name
+from renditions import Transcoder
+import metrics
 
 # Initialize logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,6 +20,16 @@ UPLOAD_FOLDER = 'videos'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# SQLite index of uploads (ids, thumbnails, inference results) used by the dashboard
+CATALOG_DB = 'catalog.db'
+catalog = VideoCatalog(CATALOG_DB, UPLOAD_FOLDER)
+# Background thumbnail/preview generation; uploads only enqueue work
+thumbnailer = Thumbnailer(catalog, UPLOAD_FOLDER)
+# Optional low-bitrate preview renditions for playback over slow links
+transcoder = Transcoder(catalog, UPLOAD_FOLDER)
+# Browser cache lifetime for media; ETag/Last-Modified revalidate after that
+MEDIA_MAX_AGE = 3600
+
 # Allowed video extensions
 ALLOWED_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov'}
 
@@ -23,29 +37,10 @@ def allowed_file(filename):
     """Check if the uploaded file has an allowed video extension."""
     return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_thumbnail(video_path, thumbnail_path):
-    """Generate a thumbnail using FFmpeg."""
-    try:
-        subprocess.run(
-            ['ffmpeg', '-i', video_path, '-ss', '00:00:01.000', '-vframes', '1', thumbnail_path],
-            check=True,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        logger.info(f"Thumbnail generated: {thumbnail_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg error: {e.stderr.decode()}" )  # Debugging output
-        return False
-
-def get_next_filename():
-    """Find the next available integer filename, only for MP4 uploads."""
-    existing_files = [int(os.path.splitext(f)[0]) for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.mp4') and f.split('.')[0].isdigit()]
-    next_number = max(existing_files) + 1 if existing_files else 1
-    return str(next_number)
-
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file uploads, rename them to an incrementing integer (for MP4 only), and generate a thumbnail."""
+    """Handle file uploads, rename them to an incrementing integer (for MP4 only), and queue a thumbnail."""
+    start = time.perf_counter()
     if 'file' not in request.files:
         logger.error("No file part in the request")
         return jsonify({"error": "No file part"}), 400
@@ -61,9 +56,12 @@ def upload_file():
         return jsonify({"error": f"File type {ext} is not allowed"}), 400
 
     if ext == '.mp4':
-        new_filename = f"{get_next_filename()}{ext}"
+        # Id is allocated atomically by the catalog, so concurrent uploads get distinct names
+        video_id, new_filename = catalog.allocate(ext, source_name=file.filename)
+        created = True
     else:
         new_filename = file.filename  # Keep original name for non-MP4 files
+        video_id, created = catalog.add(new_filename, source_name=file.filename)
     
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
     
@@ -72,16 +70,22 @@ def upload_file():
         logger.info(f"File saved: {file_path}")
     except Exception as e:
         logger.error(f"Failed to save file {file.filename}: {str(e)}")
+        if created:
+            catalog.delete(video_id)  # never drop the row of an earlier upload of the same file
         return jsonify({"error": "Failed to save file"}), 500
+    # Recording the size publishes the clip: listings skip rows whose file is still being written
+    catalog.update(video_id, size=os.path.getsize(file_path))
 
-    # Generate a thumbnail if the uploaded file is an MP4 video
+    # Thumbnails are generated in the background so the response only waits on the disk write
     if ext == '.mp4':
-        thumb_filename = f"{os.path.splitext(new_filename)[0]}.jpg"
-        thumb_path = os.path.join(app.config['UPLOAD_FOLDER'], thumb_filename)
-        
-        success = generate_thumbnail(file_path, thumb_path)
-        if not success:
-            return jsonify({"error": "Failed to generate thumbnail"}), 500
+        thumbnailer.enqueue(video_id, new_filename)
+        transcoder.enqueue(video_id, new_filename)
+
+    metrics.histogram("server_upload_seconds", "Server-side upload handling (receive + save)").observe(time.perf_counter() - start)
+    # The clip is listed on the dashboard from here on
+    trace_id = metrics.observe_since_trigger("trigger_to_dashboard_seconds", file.filename, "Trigger until the clip is on the dashboard")
+    if trace_id:
+        logger.info(f"Trace {trace_id}: {file.filename} stored as {new_filename}")
 
     return jsonify({"message": f"File uploaded successfully as {new_filename}!"})
 
@@ -100,43 +104,108 @@ def upload_json():
             json.dump(data, json_file, indent=4)
         
         logger.info(f"JSON file saved: {json_path}")
+
+        # Attach the inference result to the uploaded clip it describes
+        if isinstance(data, dict) and data.get("File") and data.get("Result"):
+            metrics.observe_since_trigger("trigger_to_result_seconds", data["File"], "Trigger until the inference result is on the dashboard")
+            video_id = catalog.set_result_by_source(os.path.basename(data["File"]), data["Result"], data.get("Timestamp"),
+                                                    data.get("Timeline"))
+            if video_id is not None:
+                logger.info(f"Inference result attached to video {video_id}")
         return jsonify({"message": f"JSON uploaded successfully as {json_filename}!"})
     except Exception as e:
         logger.error(f"Failed to save JSON file: {str(e)}")
         return jsonify({"error": "Failed to save JSON file"}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Server-side stage timings in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def get_page_args():
+    """Reads cursor/limit/label query parameters for paginated video listings."""
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', default=DEFAULT_PAGE_SIZE, type=int)
+    label = request.args.get('label') or None
+    return cursor, limit, label
+
 @app.route('/')
 def dashboard():
-    """Render the dashboard with the list of uploaded videos and their thumbnails."""
-    videos = []
-    
-    for file in os.listdir(app.config['UPLOAD_FOLDER']):
-        ext = os.path.splitext(file)[1].lower()
-        if ext in ALLOWED_EXTENSIONS:
-            thumb_filename = os.path.splitext(file)[0] + '.jpg'
-            thumb_path = os.path.join(app.config['UPLOAD_FOLDER'], thumb_filename)
-            thumbnail_exists = os.path.exists(thumb_path)
-            
-            videos.append({
-                'video': file,
-                'thumbnail': thumb_filename if thumbnail_exists else None
-            })
-    
-    return render_template('index.html', videos=videos)
+    """Render one page of uploaded videos and their thumbnails from the catalog."""
+    cursor, limit, label = get_page_args()
+    rows, next_cursor = catalog.list(cursor=cursor, limit=limit, label=label)
+    videos = [{
+        'id': row['id'],
+        'video': row['filename'],
+        # MP4s without a recorded thumbnail still get one: it is generated on first request
+        'thumbnail': row['thumbnail'] or (thumbnail_name(row['filename']) if row['filename'].endswith('.mp4') else None),
+        'preview': row['preview'],
+        'label': row['label'],
+    } for row in rows]
+    return render_template('index.html', videos=videos, next_cursor=next_cursor, label=label, limit=limit)
+
+@app.route('/api/videos')
+def list_videos():
+    """Paginated, filterable video listing, e.g. /api/videos?cursor=120&limit=24&label=Theft"""
+    cursor, limit, label = get_page_args()
+    rows, next_cursor = catalog.list(cursor=cursor, limit=limit, label=label)
+    return jsonify({"videos": rows, "next_cursor": next_cursor})
+
+@app.route('/api/videos/<int:video_id>')
+def video_metadata(video_id):
+    """Inference metadata for one video in the format shown in the dashboard modal."""
+    row = catalog.get(video_id)
+    if row is None:
+        return jsonify({"error": "Video not found"}), 404
+    return jsonify({"Timestamp": row['timestamp'], "File": row['source_name'] or row['filename'], "Result": row['result'],
+                    "Timeline": json.loads(row['timeline']) if row['timeline'] else None})
+
+@app.route('/videos/<int:video_id>')
+def stream_video(video_id):
+    """
+    Stream a catalogued video: /videos/<id>?quality=preview|original.
+    Responses are conditional: Range requests get 206 Partial Content, and
+    ETag/Last-Modified let the browser revalidate (304) instead of re-downloading.
+    """
+    row = catalog.get(video_id)
+    if row is None or not row['filename']:
+        return jsonify({"error": "File not found"}), 404
+    quality = request.args.get('quality', 'original')
+    if quality not in ('preview', 'original'):
+        return jsonify({"error": "quality must be 'preview' or 'original'"}), 400
+
+    path = os.path.join(app.config['UPLOAD_FOLDER'], row['filename'])
+    max_age = MEDIA_MAX_AGE
+    if quality == 'preview':
+        rendition_path = transcoder.rendition_path(row['filename'])
+        if os.path.exists(rendition_path):
+            path = rendition_path
+        elif row['rendition_failed'] or not transcoder.enabled:
+            pass  # no rendition is coming: serve the original, cached like any other response
+        else:
+            # Not transcoded yet: fall back to the original, and make the browser
+            # revalidate so it picks up the rendition once ready
+            transcoder.enqueue(video_id, row['filename'])
+            max_age = 0
+    if not os.path.exists(path):
+        return jsonify({"error": "File not found"}), 404
+    return send_file(path, mimetype='video/mp4', conditional=True, etag=True, max_age=max_age)
 
 @app.route('/videos/<path:filename>')
 def serve_video(filename):
     """Serve uploaded video files."""
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, conditional=True, max_age=MEDIA_MAX_AGE)
     except Exception as e:
         logger.error(f"Error serving video {filename}: {str(e)}")
         return jsonify({"error": "File not found"}), 404
 
 @app.route('/thumbnails/<path:filename>')
 def serve_thumbnail(filename):
-    """Serve generated thumbnails."""
+    """Serve generated thumbnails; a missing one is queued for generation and answered with 404."""
     try:
+        if not thumbnailer.ensure(filename):
+            return jsonify({"error": "Thumbnail not found"}), 404
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
     except Exception as e:
         logger.error(f"Error serving thumbnail {filename}: {str(e)}")
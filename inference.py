@@ -1,10 +1,10 @@
 #import gradio as gr
-import torch
-import torchvision.transforms as transforms
-from PIL import Image
-import cv2
+import os
+import threading
 import numpy as np
 import onnxruntime as ort
+from frame_sampler import sample_frames, preprocess_frames, video_info, iter_frames, FrameRing
+from metrics import histogram, timed
 
 # The folloiwng to be included in inference in pi
 #####################################################################################################################
@@ -12,48 +12,101 @@ import onnxruntime as ort
 QUANTIZED_ONNX_MODEL_PATH = "/home/admin/pi/model_quantized.onnx"
 ACTIVITIES = ['Violence', 'Theft']  # Multi-class labels
 
-# Load the ONNX model
-ort_session = ort.InferenceSession(QUANTIZED_ONNX_MODEL_PATH, providers=['CPUExecutionProvider'])
-
-# Preprocessing
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
-
-def preprocess_video(video_path, num_frames=5):
-    cap = cv2.VideoCapture(video_path)
-    frames = []
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_indices = np.linspace(0, total_frames - 1, num_frames, dtype=int)
-
-    for idx in frame_indices:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-        ret, frame = cap.read()
-        if not ret:
-            raise ValueError(f"Failed to read frame {idx} from {video_path}")
-        frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        frame = transform(frame)
-        frames.append(frame.unsqueeze(0))
-
-    cap.release()
-    return torch.cat(frames, dim=0).unsqueeze(0).numpy()  # Add batch dimension
-
-def predict(video_path):
-    # Preprocess the video
-    input_tensor = preprocess_video(video_path)
+# Session tuning (Raspberry Pi 4: 4 cores, and the capture/audio threads need some of them)
+INFERENCE_CORES = 3        # Cores for model execution, shared by all inference workers
+INTER_OP_THREADS = 1
+OPTIMIZED_MODEL_SUFFIX = ".opt.onnx"  # Cached optimized graph written next to the model
+WARMUP_RUNS = 1
 
-    ort_inputs = {ort_session.get_inputs()[0].name: input_tensor}
-    ort_outs = ort_session.run(None, ort_inputs)
-    binary_output, multi_output = ort_outs
+# Sliding-window (timeline) inference
+NUM_FRAMES = 5            # Frames per model input, as trained
+WINDOW_SECONDS = 3.0      # Footage covered by one window (NUM_FRAMES evenly spaced frames)
+STRIDE_SECONDS = 1.5      # Window start-to-start distance; windows overlap when < WINDOW_SECONDS
+TIMELINE_BATCH = 8        # Windows per session.run when the model has a dynamic batch axis
+
+_sessions = {}  # realpath of the model -> InferenceSession
+_session_lock = threading.Lock()
+
+def optimized_model_path(model_path):
+    return os.path.splitext(model_path)[0] + OPTIMIZED_MODEL_SUFFIX
+
+def intra_op_threads(workers=1, cores=INFERENCE_CORES):
+    """Intra-op threads per session.run so that `workers` concurrent runs use `cores` cores in total."""
+    return max(1, cores // max(1, workers))
+
+def create_session(model_path=QUANTIZED_ONNX_MODEL_PATH, intra_threads=None,
+                   inter_threads=INTER_OP_THREADS, warmup_runs=WARMUP_RUNS):
+    """
+    Builds a tuned InferenceSession (intra_threads defaults to intra_op_threads()).
+    The first run saves the optimized graph to <model>.opt.onnx; later runs load that file
+    with optimization turned off, so graph optimization only ever happens once per model.
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_threads or intra_op_threads()
+    options.inter_op_num_threads = inter_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+    cached_path = optimized_model_path(model_path)
+    if os.path.exists(cached_path) and os.path.getmtime(cached_path) >= os.path.getmtime(model_path):
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        load_path = cached_path
+    else:
+        # EXTENDED rather than ALL: layout optimizations are hardware specific and
+        # should not be baked into a saved model
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = cached_path
+        load_path = model_path
+
+    session = ort.InferenceSession(load_path, options, providers=['CPUExecutionProvider'])
+    warmup(session, warmup_runs)
+    return session
 
+def warmup(session, runs=WARMUP_RUNS):
+    """Runs a zero input through the model so the first real clip doesn't pay for allocation."""
+    model_input = session.get_inputs()[0]
+    shape = [d if isinstance(d, int) else 1 for d in model_input.shape]
+    dummy = np.zeros(shape, dtype=np.float32)
+    for _ in range(runs):
+        session.run(None, {model_input.name: dummy})
+
+def get_session(model_path=None, intra_threads=None):
+    """
+    Returns the shared session for model_path (default QUANTIZED_ONNX_MODEL_PATH), creating
+    it on first use; intra_threads only applies to that first call.
+    """
+    key = os.path.realpath(model_path or QUANTIZED_ONNX_MODEL_PATH)
+    session = _sessions.get(key)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = create_session(key, intra_threads)
+    return session
+
+# Preprocessing: single-pass frame sampling + one vectorised resize/normalise step
+# (approximates Resize((224, 224)) -> ToTensor() -> Normalize(ImageNet mean/std); cv2's INTER_AREA
+# downscaling is not PIL's bilinear Resize, so pixel values differ slightly from training)
+def preprocess_video(video_path, num_frames=5, out=None):
+    with timed("decode_seconds", "Frame sampling (decode) per clip"):
+        frames = sample_frames(video_path, num_frames)
+    with timed("preprocess_seconds", "Resize + normalise per clip"):
+        return preprocess_frames(frames, out=out)  # (1, num_frames, 3, 224, 224) float32
+
+def softmax(x):
+    e = np.exp(x - np.max(x))
+    return e / e.sum()
+
+def supports_batching(model_path=None):
+    """True when the model was exported with a dynamic batch axis."""
+    return not isinstance(get_session(model_path).get_inputs()[0].shape[0], int)
+
+def format_result(binary_output, multi_output):
     # Determine if the activity is suspicious
-    is_suspicious = binary_output[0][0] > 0.5
+    is_suspicious = binary_output[0] > 0.5
 
     if is_suspicious:
         # Get the probabilities and predicted class
-        probabilities = torch.softmax(torch.tensor(multi_output[0]), dim=0).numpy()
+        probabilities = softmax(np.asarray(multi_output, dtype=np.float32))
         activity_index = np.argmax(probabilities)
         activity_name = ACTIVITIES[activity_index]
         probability_score = probabilities[activity_index] * 100  # Convert to percentage
@@ -61,6 +114,203 @@ def predict(video_path):
     else:
         return "No suspicious activity detected."
 
+def predict(video_path, model_path=None):
+    # Preprocess the video
+    input_tensor = preprocess_video(video_path)
+
+    ort_session = get_session(model_path)
+    ort_inputs = {ort_session.get_inputs()[0].name: input_tensor}
+    with timed("onnx_run_seconds", "ONNX Runtime session.run call"):
+        ort_outs = ort_session.run(None, ort_inputs)
+    binary_output, multi_output = ort_outs
+
+    return format_result(binary_output[0], multi_output[0])
+
+def predict_batch(video_paths, num_frames=5, model_path=None):
+    """
+    Runs several clips through the model in one session.run call.
+    Returns one result per path in the same order; clips that fail to decode get None.
+    Models exported with a fixed batch of 1 are run clip by clip.
+    """
+    batch = np.empty((len(video_paths), num_frames, 3, 224, 224), dtype=np.float32)
+    rows = []
+    for i, video_path in enumerate(video_paths):
+        n = len(rows)
+        try:
+            preprocess_video(video_path, num_frames, out=batch[n:n + 1])
+            rows.append(i)
+        except Exception as e:
+            print(f"[Inference] Failed to preprocess {video_path}: {e}")
+
+    results = [None] * len(video_paths)
+    if not rows:
+        return results
+
+    binary_output, multi_output = run_model(batch[:len(rows)], model_path)
+    for n, i in enumerate(rows):
+        results[i] = format_result(binary_output[n], multi_output[n])
+    return results
+
+def run_model(batch, model_path=None):
+    """
+    Runs a (B, frames, 3, 224, 224) batch and returns (binary_output, multi_output) with B rows.
+    Models exported with a fixed batch of 1 are run one row at a time.
+    """
+    ort_session = get_session(model_path)
+    input_name = ort_session.get_inputs()[0].name
+    run_timer = histogram("onnx_run_seconds", "ONNX Runtime session.run call")
+    if supports_batching(model_path):
+        with run_timer.time():
+            binary_output, multi_output = ort_session.run(None, {input_name: batch})
+        return binary_output, multi_output
+    outs = []
+    for n in range(len(batch)):
+        with run_timer.time():
+            outs.append(ort_session.run(None, {input_name: batch[n:n + 1]}))
+    return np.concatenate([o[0] for o in outs]), np.concatenate([o[1] for o in outs])
+
+def segment(binary_output, multi_output, start, end):
+    """One timeline entry: times in seconds, the suspicious score and the activity scores."""
+    score = float(np.ravel(binary_output)[0])
+    probabilities = softmax(np.asarray(multi_output, dtype=np.float32))
+    best = int(np.argmax(probabilities))
+    return {
+        "start": round(start, 2),
+        "end": round(end, 2),
+        "suspicious": round(score, 4),
+        "label": ACTIVITIES[best] if score > 0.5 else None,
+        "confidence": round(float(probabilities[best]) * 100, 2),
+        "scores": {name: round(float(p), 4) for name, p in zip(ACTIVITIES, probabilities)},
+    }
+
+class WindowBatch:
+    """
+    Model input batch that sliding windows from any number of clips are written into.
+    A full batch goes through the model in one run_model call, and each window's scores
+    are appended to the segment list of the clip it came from.
+    """
+
+    def __init__(self, batch_size=TIMELINE_BATCH, num_frames=NUM_FRAMES, model_path=None):
+        self.batch = np.empty((batch_size, num_frames, 3, 224, 224), dtype=np.float32)
+        self.spans = []  # (segments, start, end) per queued row
+        self.model_path = model_path
+
+    def row(self):
+        """The (1, frames, 3, 224, 224) slot the next window is written into."""
+        n = len(self.spans)
+        return self.batch[n:n + 1]
+
+    def add(self, segments, start, end):
+        """Queues the window just written into row(); runs the batch once it is full."""
+        self.spans.append((segments, start, end))
+        if len(self.spans) == len(self.batch):
+            self.flush()
+
+    def discard(self, segments):
+        """Drops the queued windows of a clip that failed part way (always the newest rows)."""
+        while self.spans and self.spans[-1][0] is segments:
+            self.spans.pop()
+
+    def flush(self):
+        if not self.spans:
+            return
+        binary_output, multi_output = run_model(self.batch[:len(self.spans)], self.model_path)
+        for n, (segments, start, end) in enumerate(self.spans):
+            segments.append(segment(binary_output[n], multi_output[n], start, end))
+        self.spans.clear()
+
+def queue_windows(video_path, windows, segments, window_seconds=WINDOW_SECONDS,
+                  stride_seconds=STRIDE_SECONDS, num_frames=NUM_FRAMES):
+    """
+    Decodes one clip and queues its sliding windows on windows (a WindowBatch); their
+    scores land in segments once the batch runs. Returns the clip's timeline settings.
+
+    Frames are decoded on a fixed grid (window_seconds / (num_frames - 1) apart) and
+    preprocessed once into a FrameRing; each window is the newest num_frames grid
+    frames, so overlapping windows reuse them. The tail of the clip always gets a
+    window. Clips shorter than one window are scored once, like predict().
+    """
+    video_path = str(video_path)
+    fps, total_frames = video_info(video_path)
+    duration = total_frames / fps
+    window_seconds = min(window_seconds, duration) if duration > 0 else window_seconds
+    step = max(1, round(window_seconds * fps / (num_frames - 1)))   # source frames between grid frames
+    if total_frames > 1:
+        # Keep the grid inside the clip: for short clips (window_seconds == duration) the
+        # last grid frame would land on total_frames, which is never decoded
+        step = max(1, min(step, (total_frames - 1) // (num_frames - 1)))
+    stride = max(1, round(stride_seconds * fps / step))             # grid frames between windows
+
+    ring = FrameRing(num_frames)
+    decoded_at = -1  # ring.count when the last window was taken
+
+    def take_window():
+        nonlocal decoded_at
+        _, first, last = ring.window(num_frames, out=windows.row())
+        decoded_at = ring.count
+        windows.add(segments, first / fps, (last + 1) / fps)
+
+    for frame_index, frame in iter_frames(video_path, step):
+        ring.push(frame, frame_index)
+        if ring.count >= num_frames and (ring.count - num_frames) % stride == 0:
+            take_window()
+    if len(ring) < num_frames:
+        # Too few grid frames (fewer source frames than num_frames): one window over evenly spaced frames
+        preprocess_video(video_path, num_frames, out=windows.row())
+        windows.add(segments, 0.0, duration)
+    elif decoded_at != ring.count:
+        take_window()  # the tail since the last window
+    return {"duration": round(duration, 2), "window_seconds": round(window_seconds, 2),
+            "stride_seconds": round(stride * step / fps, 2)}
+
+def timeline_result(settings, segments):
+    """Timeline dict of one clip from queue_windows' settings and its scored segments."""
+    peak = max(range(len(segments)), key=lambda i: segments[i]["suspicious"])
+    top = segments[peak]
+    if top["label"]:
+        result = f"Suspicious activity detected: {top['label']} (Confidence: {top['confidence']:.2f}%)"
+    else:
+        result = "No suspicious activity detected."
+    return {"result": result, **settings, "peak": peak, "segments": segments}
+
+def predict_timeline(video_path, window_seconds=WINDOW_SECONDS, stride_seconds=STRIDE_SECONDS,
+                     num_frames=NUM_FRAMES, batch_size=TIMELINE_BATCH, model_path=None):
+    """
+    Scores the clip with the num_frames model over windows of window_seconds, every
+    stride_seconds, in a single decode pass (see queue_windows).
+
+    Returns {"result": summary string of the most suspicious window (same format as
+    predict), "duration", "window_seconds", "stride_seconds", "peak": index of that
+    window, "segments": [{"start", "end", "suspicious", "label", "confidence", "scores"}]}.
+    """
+    windows = WindowBatch(batch_size, num_frames, model_path)
+    segments = []
+    with timed("timeline_seconds", "Sliding-window inference per call (one clip or a pooled batch of clips)"):
+        settings = queue_windows(video_path, windows, segments, window_seconds, stride_seconds, num_frames)
+        windows.flush()
+    return timeline_result(settings, segments)
+
+def predict_timelines(video_paths, window_seconds=WINDOW_SECONDS, stride_seconds=STRIDE_SECONDS,
+                      num_frames=NUM_FRAMES, batch_size=TIMELINE_BATCH, model_path=None):
+    """
+    predict_timeline for several clips, with the windows of all clips pooled into shared
+    batch_size model calls (a batch can hold the tail of one clip and the start of the next).
+    Returns one timeline per path in the same order; clips that fail to decode get None.
+    """
+    windows = WindowBatch(batch_size, num_frames, model_path)
+    clips = []  # (settings, segments) per path; settings is None on failure
+    with timed("timeline_seconds", "Sliding-window inference per call (one clip or a pooled batch of clips)"):
+        for video_path in video_paths:
+            segments = []
+            try:
+                settings = queue_windows(video_path, windows, segments, window_seconds, stride_seconds, num_frames)
+            except Exception as e:
+                print(f"[Inference] Failed to decode {video_path}: {e}")
+                windows.discard(segments)
+                settings = None
+            clips.append((settings, segments))
+        windows.flush()
+    return [timeline_result(settings, segments) if settings is not None else None for settings, segments in clips]
 
 ###############################################################################################################
 # Exculde this part in pi
@@ -0,0 +1,131 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_DB = "/home/admin/pi/inference_cache.db"
+CACHE_MAX_ENTRIES = 10000  # Least recently used entries are evicted beyond this
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,          -- 'ok' or 'failed'
+    result TEXT,
+    error TEXT,
+    file TEXT,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_access ON results (last_access);
+"""
+
+def file_hash(path):
+    """BLAKE2b of the file contents, streamed in 1 MB chunks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class InferenceCache:
+    """
+    Persistent map of (clip content hash, model hash) -> prediction.
+
+    Identical clips are never decoded or inferred twice, even across restarts and
+    rescans, and a new model automatically misses. Clips that exhaust their retries
+    are stored as negative ('failed') entries so they are not retried forever.
+    """
+
+    def __init__(self, model_path, db_path=CACHE_DB, max_entries=CACHE_MAX_ENTRIES):
+        self.model_path = str(model_path)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self._model_hash = None
+        self._model_stat = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def model_hash(self):
+        """Hash of the ONNX model file, recomputed only when its size or mtime changes."""
+        try:
+            st = os.stat(self.model_path)
+            stat = (st.st_size, st.st_mtime)
+        except OSError:
+            return "missing-model"
+        if stat != self._model_stat:
+            self._model_hash = file_hash(self.model_path)
+            self._model_stat = stat
+        return self._model_hash
+
+    def key_for(self, clip_path):
+        return f"{file_hash(clip_path)}:{self.model_hash()}"
+
+    def get(self, key):
+        """Returns the cached row as a dict ({'status', 'result', 'error', ...}) or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, result, error, file FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            if row[0] == "ok":
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return {"status": row[0], "result": row[1], "error": row[2], "file": row[3]}
+
+    def put(self, key, result, file_path=None):
+        self._store(key, "ok", result, None, file_path)
+
+    def put_failure(self, key, error, file_path=None):
+        """Records a negative entry for a clip that could not be inferred."""
+        self._store(key, "failed", None, str(error), file_path)
+
+    def _store(self, key, status, result, error, file_path):
+        now = time.time()
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, status, result, error, file, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, status, result, error, str(file_path) if file_path else None, now, now)
+            )
+            if not exists:
+                self.entries += 1
+            self._evict()
+
+    def _evict(self):
+        excess = self.entries - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self.entries -= excess
+            self.evictions += excess
+
+    def stats(self):
+        with self.lock:
+            entries = self.entries
+            lookups = self.hits + self.misses + self.negative_hits
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import uuid
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9101"))  # Pi-side /metrics endpoint
+# Seconds; covers a ~1 ms detection iteration up to a multi-minute upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_TRACE_RE = re.compile(r"_t([0-9a-f]{11})([0-9a-f]{5})\b")
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+    def snapshot(self):
+        with self.lock:
+            return {"type": "counter", "help": self.help, "value": self.value}
+
+    def merge(self, snapshot, previous=None):
+        self.inc(snapshot["value"] - (previous["value"] if previous else 0.0))
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {"type": "histogram", "help": self.help, "buckets": list(self.buckets),
+                    "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def merge(self, snapshot, previous=None):
+        if tuple(snapshot["buckets"]) != self.buckets:
+            return
+        prev_counts = previous["counts"] if previous else [0] * len(self.counts)
+        with self.lock:
+            for i, (n, p) in enumerate(zip(snapshot["counts"], prev_counts)):
+                self.counts[i] += n - p
+            self.sum += snapshot["sum"] - (previous["sum"] if previous else 0.0)
+            self.count += snapshot["count"] - (previous["count"] if previous else 0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, *args)
+            return metric
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def snapshot(self):
+        """Picklable copy of every metric, for sending to another process."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def merge(self, snapshot, previous=None):
+        """
+        Adds what another process recorded since its previous snapshot (or since it
+        started, when previous is None) into the metrics of the same name here.
+        """
+        previous = previous or {}
+        for name, state in snapshot.items():
+            if state["type"] == "histogram":
+                metric = self.histogram(name, state["help"], state["buckets"])
+            else:
+                metric = self.counter(name, state["help"])
+            metric.merge(state, previous.get(name))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help_text, buckets)
+
+def counter(name, help_text=""):
+    return REGISTRY.counter(name, help_text)
+
+def timed(name, help_text=""):
+    """Context manager timing a block into the named histogram: `with timed("onnx_run_seconds"): ...`"""
+    return histogram(name, help_text).time()
+
+def render():
+    return REGISTRY.render()
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+def merge(snapshot, previous=None):
+    REGISTRY.merge(snapshot, previous)
+
+
+# -----------------------------
+# TRACE IDS
+# -----------------------------
+def new_trace_id(timestamp=None):
+    """
+    16 hex chars: trigger time in ms (11) + random (5). The trigger time travels with the id,
+    so any later stage, including the server, can compute latency since the trigger.
+    """
+    ms = int((timestamp if timestamp is not None else time.time()) * 1000)
+    return f"{ms:011x}{uuid.uuid4().hex[:5]}"
+
+def trace_filename_suffix(trace_id):
+    return f"_t{trace_id}"
+
+def trace_id_from_name(name):
+    """Extracts the trace id embedded in a recording filename, or None."""
+    match = _TRACE_RE.search(os.path.basename(str(name)))
+    return match.group(1) + match.group(2) if match else None
+
+def trace_start_time(trace_id):
+    return int(trace_id[:11], 16) / 1000
+
+def observe_since_trigger(name, file_name, help_text=""):
+    """Records the time since the clip's trigger into `name`; returns the trace id (or None)."""
+    trace_id = trace_id_from_name(file_name)
+    if trace_id:
+        histogram(name, help_text).observe(max(0.0, time.time() - trace_start_time(trace_id)))
+    return trace_id
+
+
+# -----------------------------
+# PI ENDPOINT
+# -----------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds; keep it out of the logs
+
+_server = None
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serves GET /metrics from a daemon thread. Safe to call more than once."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
@@ -0,0 +1,187 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# detected: bool, energy: fraction of watched pixels in motion (0..1),
+# boxes: list of (x, y, w, h) in full-resolution frame coordinates
+MotionResult = namedtuple("MotionResult", ["detected", "energy", "boxes"])
+
+NO_MOTION = MotionResult(False, 0.0, [])
+
+
+class MotionDetector(ABC):
+    """Base class for headless motion detectors. detect() never draws on the frame."""
+
+    @abstractmethod
+    def detect(self, frame):
+        """Returns a MotionResult for frame."""
+
+    def reset(self):
+        pass
+
+
+class FrameDiffDetector(MotionDetector):
+    """
+    The original two-frame difference on full-resolution BGR frames
+    (absdiff -> blur -> threshold -> 3x dilate -> contours). Kept as a reference
+    implementation for benchmarking.
+    """
+
+    def __init__(self, min_area=8000, threshold=20):
+        self.min_area = min_area
+        self.threshold = threshold
+        self.prev_frame = None
+
+    def reset(self):
+        self.prev_frame = None
+
+    def detect(self, frame):
+        prev, self.prev_frame = self.prev_frame, frame
+        if prev is None:
+            return NO_MOTION
+        diff = cv2.absdiff(prev, frame)
+        gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+        blur = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, thresh = cv2.threshold(blur, self.threshold, 255, cv2.THRESH_BINARY)
+        dilated = cv2.dilate(thresh, None, iterations=3)
+        contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= self.min_area]
+        energy = cv2.countNonZero(thresh) / thresh.size
+        return MotionResult(bool(boxes), energy, boxes)
+
+
+class BackgroundMotionDetector(MotionDetector):
+    """
+    Low-cost motion detector for headless use.
+
+    - Works on a grayscale frame downscaled by `scale` (0.25 turns 640x480 into 160x120).
+    - Compares against a background model ("running_average" or "mog2") instead of
+      the previous frame, so slow lighting drift is absorbed.
+    - `ignore_polygons` masks out areas (e.g. a street-facing window) and
+      `roi_polygons`, when given, restricts detection to those areas. Polygons are
+      lists of (x, y) points in full-resolution coordinates.
+    - While the scene is idle the detector skips frames, up to `max_skip` between
+      processed frames, and drops back to every frame as soon as motion appears.
+    """
+
+    def __init__(self, method="running_average", scale=0.25, min_area=8000, threshold=25,
+                 learning_rate=0.05, ignore_polygons=None, roi_polygons=None,
+                 max_skip=3, idle_frames_per_skip=30):
+        if method not in ("running_average", "mog2"):
+            raise ValueError(f"Unknown motion method: {method}")
+        self.method = method
+        self.scale = scale
+        self.min_area = min_area * scale * scale  # area threshold in downscaled pixels
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+        self.ignore_polygons = ignore_polygons or []
+        self.roi_polygons = roi_polygons or []
+        self.max_skip = max_skip
+        self.idle_frames_per_skip = idle_frames_per_skip
+        self.reset()
+
+    def reset(self):
+        self.background = None
+        self.subtractor = None
+        self.mask = None
+        self.mask_area = 0
+        self.skip = 0
+        self.frames_since_processed = 0
+        self.idle_count = 0
+        self.last_result = NO_MOTION
+
+    def _build_mask(self, shape):
+        h, w = shape
+        if self.roi_polygons:
+            mask = np.zeros((h, w), dtype=np.uint8)
+            for poly in self.roi_polygons:
+                cv2.fillPoly(mask, [self._scale_polygon(poly)], 255)
+        else:
+            mask = np.full((h, w), 255, dtype=np.uint8)
+        for poly in self.ignore_polygons:
+            cv2.fillPoly(mask, [self._scale_polygon(poly)], 0)
+        self.mask_area = max(1, cv2.countNonZero(mask))
+        # A full mask needs no masking step at all
+        self.mask = None if self.mask_area == h * w else mask
+
+    def _scale_polygon(self, poly):
+        return np.round(np.asarray(poly, dtype=np.float32) * self.scale).astype(np.int32)
+
+    def _foreground(self, gray):
+        if self.method == "mog2":
+            if self.subtractor is None:
+                self.subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+            fg = self.subtractor.apply(gray, learningRate=self.learning_rate)
+            _, fg = cv2.threshold(fg, 127, 255, cv2.THRESH_BINARY)
+            return fg
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return None
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        _, fg = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        return fg
+
+    def _update_skip(self, detected):
+        if detected:
+            self.skip = 0
+            self.idle_count = 0
+            return
+        self.idle_count += 1
+        if self.idle_count >= self.idle_frames_per_skip and self.skip < self.max_skip:
+            self.skip += 1
+            self.idle_count = 0
+
+    def detect(self, frame):
+        if self.frames_since_processed < self.skip:
+            self.frames_since_processed += 1
+            return self.last_result
+        self.frames_since_processed = 0
+
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        if self.mask is None and self.mask_area == 0:
+            self._build_mask(gray.shape)
+
+        fg = self._foreground(gray)
+        if fg is None:
+            return NO_MOTION
+        if self.mask is not None:
+            cv2.bitwise_and(fg, self.mask, dst=fg)
+
+        energy = cv2.countNonZero(fg) / self.mask_area
+        boxes = []
+        if energy > 0:
+            fg = cv2.dilate(fg, None, iterations=1)
+            contours, _ = cv2.findContours(fg, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            inv = 1.0 / self.scale
+            for contour in contours:
+                if cv2.contourArea(contour) < self.min_area:
+                    continue
+                x, y, w, h = cv2.boundingRect(contour)
+                boxes.append((int(x * inv), int(y * inv), int(w * inv), int(h * inv)))
+
+        result = MotionResult(bool(boxes), energy, boxes)
+        self._update_skip(result.detected)
+        self.last_result = result
+        return result
+
+
+def create_detector(method="running_average", **kwargs):
+    """Factory used by sensor_input; "framediff" selects the original algorithm."""
+    if method == "framediff":
+        return FrameDiffDetector(min_area=kwargs.get("min_area", 8000))
+    return BackgroundMotionDetector(method=method, **kwargs)
+
+
+def draw_motion(frame, result):
+    """Draws bounding boxes for a preview window on a copy of the frame."""
+    display = frame.copy()
+    for (x, y, w, h) in result.boxes:
+        cv2.rectangle(display, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    if result.detected:
+        cv2.putText(display, "Movement", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+    return display
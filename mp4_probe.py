@@ -0,0 +1,137 @@
+import os
+import struct
+from collections import namedtuple
+
+# status: "valid", "invalid" or "unknown" (the parser can't tell; fall back to ffprobe)
+ProbeResult = namedtuple("ProbeResult", ["status", "reason", "duration", "codec"])
+
+MP4_EXTENSIONS = (".mp4", ".m4v", ".mov")
+KNOWN_LEADING_BOXES = {b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+MAX_MOOV_BYTES = 16 * 1024 * 1024  # moov is only metadata; anything bigger is suspect
+
+def _iter_boxes(data, start=0, end=None):
+    """Yields (type, payload_start, box_end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                raise ValueError("truncated box header")
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f"box {box_type!r} overruns its parent")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+def _find(data, path, start=0, end=None):
+    """Depth-first search for the first box matching path (e.g. [b"mdia", b"hdlr"])."""
+    for box_type, payload, box_end in _iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            found = _find(data, path[1:], payload, box_end)
+            if found:
+                return found
+    return None
+
+def _parse_moov(moov):
+    """Returns (duration_seconds, video_codec) from a moov payload."""
+    duration = None
+    mvhd = _find(moov, [b"mvhd"])
+    if mvhd:
+        payload = mvhd[0]
+        if moov[payload] == 1:
+            timescale, length = struct.unpack_from(">IQ", moov, payload + 20)
+        else:
+            timescale, length = struct.unpack_from(">II", moov, payload + 12)
+        duration = length / timescale if timescale else None
+
+    codec = None
+    for box_type, payload, box_end in _iter_boxes(moov):
+        if box_type != b"trak":
+            continue
+        hdlr = _find(moov, [b"mdia", b"hdlr"], payload, box_end)
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+            continue
+        stsd = _find(moov, [b"mdia", b"minf", b"stbl", b"stsd"], payload, box_end)
+        if stsd and stsd[1] - stsd[0] >= 16:
+            # version/flags (4), entry_count (4), then the first sample entry's size (4) and format (4)
+            codec = moov[stsd[0] + 12:stsd[0] + 16].decode("latin-1")
+        break
+    return duration, codec
+
+def probe_mp4(path):
+    """
+    Checks an MP4 without spawning a process: walks the top-level boxes (reading only
+    their headers), requires ftyp, moov and mdat, rejects boxes that run past the end of
+    the file (truncated writes), and reads the duration and video codec from moov.
+    """
+    if not str(path).lower().endswith(MP4_EXTENSIONS):
+        return ProbeResult("unknown", "not an MP4 container", None, None)
+    try:
+        file_size = os.path.getsize(path)
+        boxes = {}
+        with open(path, "rb") as f:
+            pos = 0
+            first = None
+            while pos + 8 <= file_size:
+                f.seek(pos)
+                header = f.read(16)
+                size, box_type = struct.unpack_from(">I4s", header)
+                header_size = 8
+                if size == 1:
+                    if len(header) < 16:
+                        return ProbeResult("invalid", "truncated box header", None, None)
+                    size = struct.unpack_from(">Q", header, 8)[0]
+                    header_size = 16
+                elif size == 0:
+                    size = file_size - pos
+                if first is None:
+                    first = box_type
+                    if box_type != b"ftyp":
+                        # QuickTime files may start with wide/free/mdat; let ffprobe decide those
+                        status = "unknown" if box_type in KNOWN_LEADING_BOXES else "invalid"
+                        return ProbeResult(status, "no leading ftyp box", None, None)
+                if size < header_size:
+                    return ProbeResult("invalid", f"corrupt box size at offset {pos}", None, None)
+                if pos + size > file_size:
+                    return ProbeResult("invalid", f"truncated: {box_type.decode('latin-1')} box ends past end of file", None, None)
+                boxes.setdefault(box_type, (pos + header_size, pos + size))
+                pos += size
+            if pos != file_size:
+                return ProbeResult("invalid", "trailing bytes after the last box", None, None)
+            if first is None:
+                return ProbeResult("invalid", "empty file", None, None)
+            if b"moof" in boxes:
+                return ProbeResult("unknown", "fragmented MP4", None, None)
+            if b"moov" not in boxes or b"mdat" not in boxes:
+                return ProbeResult("invalid", "missing moov or mdat", None, None)
+
+            start, end = boxes[b"moov"]
+            if end - start > MAX_MOOV_BYTES:
+                return ProbeResult("unknown", "moov box too large to parse", None, None)
+            f.seek(start)
+            moov = f.read(end - start)
+    except OSError as e:
+        return ProbeResult("unknown", f"read error: {e}", None, None)
+
+    try:
+        duration, codec = _parse_moov(moov)
+    except (ValueError, struct.error, IndexError) as e:
+        return ProbeResult("unknown", f"unparsed moov: {e}", None, None)
+    if codec is None:
+        return ProbeResult("invalid", "no video track", duration, None)
+    if not duration:
+        return ProbeResult("invalid", "zero duration", duration, codec)
+    return ProbeResult("valid", "ok", duration, codec)
+
+
+if __name__ == "__main__":
+    import sys
+    for clip in sys.argv[1:]:
+        print(clip, probe_mp4(clip))
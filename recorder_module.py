@@ -3,6 +3,7 @@ import shutil
 import time
 import subprocess
 import threading
+import queue
 import json
 import sys
 import logging
@@ -10,10 +11,17 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from sensor_input import main as start_sensor
-from sendFile import send_file
-from inference import predict
-from alerts import get_system_warnings
+from sensor_input import main as start_sensor, frame_queue
+from sendFile import enqueue_file, enqueue_result, get_uploader
+from inference import predict_batch, predict_timelines, get_session, intra_op_threads, INFERENCE_CORES
+from health_monitor import get_health_monitor
+from event_log import get_event_log
+from inference_cache import InferenceCache, CACHE_DB
+from retention import get_retention_manager
+from mp4_probe import probe_mp4
+from work_queue import WorkQueue, QUEUE_DB
+from metrics import (timed, counter, observe_since_trigger, trace_id_from_name, trace_start_time,
+                     start_metrics_server, METRICS_PORT)
 
 # Suppress ALSA device errors
 os.environ["AUDIODEV"] = "null"
@@ -29,46 +37,127 @@ logging.basicConfig(
     ]
 )
 
-INFERENCE_LOG_FILE = "/home/admin/pi/inference_results.json"
+INFERENCE_LOG_FILE = "/home/admin/pi/inference_results.jsonl"
 WARNING_JSON_DIR = "/home/admin/pi/"
+WARNING_LOG_FILE = "/home/admin/pi/log.jsonl"
 RETRY_LIMIT = 5
 RETRY_DELAY = 2  # seconds, exponential backoff applied
+INFERENCE_WORKERS = 1  # Threads claiming clips from the work queue; they split INFERENCE_CORES between them
+STREAMING_INFERENCE = True  # Score clips over sliding windows (per-segment timeline) instead of once per clip
+INFERENCE_BATCH_SIZE = 4  # Max clips per ort_session.run call
+INFERENCE_BATCH_WAIT_MS = 200  # Max time to wait for a batch to fill up
+VALIDATION_WORKERS = 2  # Threads validating new clips off the watchdog thread
+VALIDATION_QUEUE_SIZE = 256
+
+def clip_priority(file_path):
+    """Newest trigger first: the trigger time from the clip's trace id, else its mtime."""
+    trace_id = trace_id_from_name(file_path)
+    if trace_id:
+        return trace_start_time(trace_id)
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return time.time()
 
 class RecorderHandler(FileSystemEventHandler):
-    def __init__(self, recorder):
+    def __init__(self, recorder, retention):
         self.recorder = recorder
+        self.retention = retention
 
     def on_closed(self, event):
         if event.is_directory:
             return
         if event.src_path.endswith(".mp4"):
             logging.info(f"[Watchdog] New file detected: {event.src_path}")
-            self.recorder.queue_file(Path(event.src_path))
+            counter("watchdog_files_total", "MP4 close events seen by the watchdog").inc()
+            observe_since_trigger("trigger_to_watchdog_seconds", event.src_path, "Trigger until the watchdog sees the clip")
+            with timed("watchdog_on_closed_seconds", "Watchdog handler time (indexing + enqueueing for validation)"):
+                self.retention.add(event.src_path)
+                self.recorder.queue_file(Path(event.src_path))
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.retention.remove(event.src_path)
+            self.recorder.work_queue.discard(event.src_path)
 
 class RecorderModule:
-    def __init__(self, save_dir="/home/admin/pi/recordings", max_storage_gb=5, ai_model_path="/home/admin/pi/model_quantized.onnx", max_file_age_days=7):
+    def __init__(self, save_dir="/home/admin/pi/recordings", max_storage_gb=5, ai_model_path="/home/admin/pi/model_quantized.onnx", max_file_age_days=7,
+                 batch_size=INFERENCE_BATCH_SIZE, batch_wait_ms=INFERENCE_BATCH_WAIT_MS, cache_db=CACHE_DB,
+                 metrics_port=METRICS_PORT, queue_db=QUEUE_DB, inference_workers=INFERENCE_WORKERS,
+                 streaming=STREAMING_INFERENCE, inference_cores=INFERENCE_CORES):
         self.script_start_time = datetime.now()
         self.save_dir = Path(save_dir)
         self.max_storage_bytes = max_storage_gb * (1024 ** 3)
         self.ai_model_path = ai_model_path
         self.max_file_age_days = max_file_age_days
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        self.streaming = streaming
+        self.inference_workers = inference_workers
+        self.inference_cores = inference_cores  # model threads in total, however many workers run
         self.processed_files = {}
-        self.pending_files = set()
+        self.inference_cache = InferenceCache(ai_model_path, cache_db)
+        # Persistent, prioritised queue of validated clips; survives restarts
+        self.work_queue = WorkQueue(queue_db, max_attempts=RETRY_LIMIT + 1, retry_delay=RETRY_DELAY)
         self.save_dir.mkdir(parents=True, exist_ok=True)
-        self.start_watchdog()
-        self.new_file_event = threading.Event()
+        # Enforces max_storage_gb (high/low watermarks) and max_file_age_days (periodic sweep)
+        self.retention = get_retention_manager(self.save_dir, max_bytes=self.max_storage_bytes,
+                                               max_age_days=max_file_age_days)
+        self.retention.start()
+        self.retentions = {str(self.save_dir): self.retention}  # one per watched folder
+        get_uploader().add_listener(self.mark_uploaded)
+        if metrics_port:
+            start_metrics_server(metrics_port)  # Prometheus text format at http://<pi>:<port>/metrics
+        self.validation_queue = queue.Queue(maxsize=VALIDATION_QUEUE_SIZE)
+        for i in range(VALIDATION_WORKERS):
+            threading.Thread(target=self.validation_worker, name=f"validator-{i}", daemon=True).start()
+        self.observer = None
+        self.start_watchdog()  # after the queues exist, so early events have somewhere to go
+        self.health = get_health_monitor(frame_queue)
+        self.health.start()
+        self.last_warnings = None
+        self.warning_sources = []  # extra callables returning warnings (e.g. per-camera health)
         self.warning_thread = threading.Thread(target=self.start_warning_monitor, daemon=True)
         self.warning_thread.start()
-        self.inference_thread = threading.Thread(target=self.process_pending_files, daemon=True)
-        self.inference_thread.start()
+        self.inference_threads = []
+        for i in range(inference_workers):
+            thread = threading.Thread(target=self.process_pending_files, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self.inference_threads.append(thread)
+        threading.Thread(target=self.rescan_unprocessed, args=(self.save_dir,), name="rescan", daemon=True).start()
 
     def start_watchdog(self):
-        event_handler = RecorderHandler(self)
-        observer = Observer()
-        observer.schedule(event_handler, str(self.save_dir), recursive=False)
-        observer.start()
+        self.observer = Observer()
+        self.observer.schedule(RecorderHandler(self, self.retention), str(self.save_dir), recursive=False)
+        self.observer.start()
         logging.info("[Watchdog] Started monitoring file changes.")
 
+    def add_source(self, directory, max_storage_gb=None):
+        """
+        Watches another recordings folder (e.g. one per camera) and feeds its clips into
+        the same validation pool and work queue. The folder gets its own retention manager,
+        using this recorder's quota unless max_storage_gb is given.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        key = str(directory)
+        if key in self.retentions:
+            return self.retentions[key]
+        max_bytes = max_storage_gb * (1024 ** 3) if max_storage_gb else self.max_storage_bytes
+        retention = get_retention_manager(directory, max_bytes=max_bytes, max_age_days=self.max_file_age_days)
+        retention.start()
+        self.retentions[key] = retention
+        self.observer.schedule(RecorderHandler(self, retention), key, recursive=False)
+        threading.Thread(target=self.rescan_unprocessed, args=(directory,), name=f"rescan-{directory.name}", daemon=True).start()
+        logging.info(f"[Watchdog] Also monitoring {directory}.")
+        return retention
+
+    def retention_for(self, file_path):
+        return self.retentions.get(os.path.dirname(str(file_path)), self.retention)
+
+    def mark_uploaded(self, file_path):
+        self.retention_for(file_path).mark_uploaded(file_path)
+
     #forgot to reimplement this,remove/comment out this and the function in sensor_thread if its not working
     def handle_amplitude(self, amp):
         print(f"[Recorder module] Received amplitude: {amp}")
@@ -77,80 +166,215 @@ class RecorderModule:
 
 
     def is_valid_video(self, file_path):
+        """
+        Checks the MP4 box structure in-process (ftyp/moov/mdat, duration, video codec,
+        truncation). ffprobe is only spawned for files the parser can't decide on.
+        """
+        with timed("mp4_probe_seconds", "In-process MP4 structure check"):
+            probe = probe_mp4(file_path)
+        if probe.status == "valid":
+            logging.info(f"[Validation] {file_path}: {probe.codec}, {probe.duration:.1f}s")
+            return True
+        if probe.status == "invalid":
+            logging.warning(f"[Validation] {file_path}: {probe.reason}")
+            return False
+        logging.info(f"[Validation] {file_path}: {probe.reason}; falling back to ffprobe")
         try:
-            result = subprocess.run([
-                "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1", str(file_path)
-            ], capture_output=True, text=True)
+            with timed("ffprobe_validate_seconds", "ffprobe validation of a new clip"):
+                result = subprocess.run([
+                    "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1", str(file_path)
+                ], capture_output=True, text=True)
             return bool(result.stdout.strip())
         except Exception as e:
             logging.error(f"[Validation] Failed to verify video file: {file_path} - {e}")
             return False
 
     def queue_file(self, file_path):
+        """Hands a new clip to the validation pool; returns immediately on the watchdog thread."""
+        self.validation_queue.put(file_path)
+
+    def validation_worker(self):
+        while True:
+            file_path = self.validation_queue.get()
+            try:
+                self.validate_and_queue(file_path)
+            except Exception as e:
+                logging.error(f"[Validation] Failed on {file_path}: {e}")
+            finally:
+                self.validation_queue.task_done()
+
+    def validate_and_queue(self, file_path):
         if not self.is_valid_video(file_path):
             logging.warning(f"[Validation] {file_path} is not a valid video file. Skipping.")
             return
-        logging.info(f"[Queue] Adding {file_path} to pending queue.")
-        self.pending_files.add(file_path)
-        self.new_file_event.set()
+        logging.info(f"[Queue] Adding {file_path} to the work queue.")
+        self.work_queue.enqueue(file_path, clip_priority(file_path))
+
+    def rescan_unprocessed(self, directory):
+        """Startup: queues recordings the work queue has never seen (e.g. written while the recorder was down)."""
+        found = 0
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".mp4") and not self.work_queue.known(entry.path):
+                    self.queue_file(Path(entry.path))
+                    found += 1
+        logging.info(f"[Queue] Startup rescan of {directory}: {found} unprocessed recording(s); queue {self.work_queue.stats()}")
+
+    def is_backlogged(self):
+        """Backpressure for the sensor loop: True while the work queue is deeper than its high-water mark."""
+        return self.work_queue.is_backlogged()
 
     def process_pending_files(self):
+        try:
+            # Load and warm up the model before the first clip arrives
+            get_session(self.ai_model_path, intra_op_threads(self.inference_workers, self.inference_cores))
+        except Exception as e:
+            logging.error(f"[Inference] Could not load model: {e}")
         while True:
-            self.new_file_event.wait()
-            while self.pending_files:
-                file_path = self.pending_files.pop()
-                self.process_new_file(file_path)
-            self.new_file_event.clear()
-
-    def process_new_file(self, file_path):
-        retries = 0
-        while retries <= RETRY_LIMIT:
-            if self.run_inference(file_path):
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                # Never lose a claimed clip: count it as a failed attempt
+                logging.error(f"[Inference] Batch failed: {e}")
+                for file_path in batch:
+                    self.handle_failure(file_path, None, e)
+
+    def collect_batch(self):
+        """
+        Claims up to batch_size due clips, highest priority first. Once the first clip is
+        claimed, waits at most batch_wait_ms for the batch to fill.
+        """
+        batch = self.work_queue.claim(self.batch_size)
+        if not batch:
+            self.work_queue.wait(timeout=1.0)
+            return self.work_queue.claim(self.batch_size)
+        deadline = time.monotonic() + self.batch_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.work_queue.wait(remaining)
+            batch += self.work_queue.claim(self.batch_size - len(batch))
+        return batch
+
+    def process_batch(self, batch):
+        keys = {}
+        misses = []
+        for file_path in batch:
+            if not os.path.exists(file_path):
+                logging.warning(f"[Queue] {file_path} no longer exists. Dropping it.")
+                self.work_queue.discard(file_path)
+                continue
+            key, cached = self.lookup_cached(file_path)
+            if cached is not None:
+                self.handle_cached(file_path, cached)
+                self.work_queue.complete(file_path)
+                continue
+            keys[file_path] = key
+            misses.append(file_path)
+        if not misses:
+            return
+        results = self.run_inference_batch(misses, keys)
+        for file_path, success in zip(misses, results):
+            if success:
                 self.processed_files[file_path] = "Success"
+                self.work_queue.complete(file_path)
                 logging.info(f"[Processed] {file_path}")
-                return
-            retries += 1
-            delay = RETRY_DELAY * (2 ** (retries - 1))
-            logging.warning(f"[Retry {retries}] {file_path} failed inference. Retrying in {delay} seconds.")
-            time.sleep(delay)
-        logging.error(f"[Skip] {file_path} failed inference too many times. Adding back to queue.")
-        self.queue_file(file_path)
-
-    def run_inference(self, file_path):
+            else:
+                self.handle_failure(file_path, keys.get(file_path), "inference failed")
+
+    def handle_failure(self, file_path, key, error):
+        """Schedules a retry by timestamp (no worker sleeps on it), or dead-letters the clip."""
+        outcome = self.work_queue.fail(file_path, error)
+        if outcome is None:
+            return
+        status, attempts, delay = outcome
+        if status != "dead":
+            logging.warning(f"[Retry {attempts}] {file_path} failed inference. Retrying in {delay} seconds.")
+            return
+        # Negative cache entry: the same clip (e.g. after a restart or rescan) is not retried again
+        self.processed_files[file_path] = "Failed"
+        if key is not None:
+            self.inference_cache.put_failure(key, f"failed {attempts} attempts", file_path)
+        logging.error(f"[Skip] {file_path} failed inference too many times. Moved to dead letters.")
+
+    def lookup_cached(self, file_path):
+        """Returns (cache_key, cached_entry); cached_entry is None on a miss."""
+        try:
+            key = self.inference_cache.key_for(file_path)
+        except OSError as e:
+            logging.error(f"[Cache] Could not hash {file_path}: {e}")
+            return None, None
+        return key, self.inference_cache.get(key)
+
+    def handle_cached(self, file_path, cached):
+        if cached["status"] == "ok":
+            self.processed_files[file_path] = "Success"
+            logging.info(f"[Cache] Hit for {file_path}: {cached['result']} (already logged and uploaded)")
+        else:
+            self.processed_files[file_path] = "Failed"
+            logging.warning(f"[Cache] {file_path} previously failed inference ({cached['error']}). Not retrying.")
+
+    def run_inference_batch(self, file_paths, keys=None):
+        """
+        Runs one model call for the whole batch (or, when streaming, the sliding windows of
+        all clips pooled into shared model calls) and handles each clip's result separately.
+        """
         try:
-            logging.info(f"[Inference] Running AI on {file_path} with model at {self.ai_model_path}")
-            result = predict(str(file_path))
+            logging.info(f"[Inference] Running AI on batch of {len(file_paths)} with model at {self.ai_model_path}")
+            if self.streaming:
+                timelines = predict_timelines([str(p) for p in file_paths], model_path=self.ai_model_path)
+                results = [t["result"] if t else None for t in timelines]
+            else:
+                timelines = [None] * len(file_paths)
+                results = predict_batch([str(p) for p in file_paths], model_path=self.ai_model_path)
+        except Exception as e:
+            logging.error(f"[Error] Batch inference failed: {e}")
+            return [False] * len(file_paths)
+
+        outcomes = []
+        for file_path, result, timeline in zip(file_paths, results, timelines):
             if not result or "Error" in result:
                 logging.error(f"[Error] Inference failed for {file_path}")
-                return False
-            self.log_inference_result(file_path, result)
-            send_file(str(file_path))
-            return True
-        except Exception as e:
-            logging.error(f"[Error] Inference failed on {file_path}: {e}")
-            return False
+                outcomes.append(False)
+                continue
+            try:
+                self.log_inference_result(file_path, result, timeline)
+                enqueue_file(file_path)  # uploaded in the background
+                if keys and keys.get(file_path):
+                    self.inference_cache.put(keys[file_path], result, file_path)
+                outcomes.append(True)
+            except Exception as e:
+                logging.error(f"[Error] Inference failed on {file_path}: {e}")
+                outcomes.append(False)
+        return outcomes
 
-    def log_inference_result(self, file_path, result):
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        logs = []
-        if os.path.exists(INFERENCE_LOG_FILE):
-            with open(INFERENCE_LOG_FILE, "r") as f:
-                try:
-                    logs = json.load(f)
-                except json.JSONDecodeError:
-                    pass
-        log_entry = {"Timestamp": timestamp, "File": str(file_path), "Result": result}
-        logs.append(log_entry)
-        with open(INFERENCE_LOG_FILE, "w") as f:
-            json.dump(logs, f, indent=4)
-        logging.info(f"[Log] Inference result saved: {log_entry}")
+    def log_inference_result(self, file_path, result, timeline=None):
+        self.retention_for(file_path).set_label(file_path, result)
+        trace_id = observe_since_trigger("trigger_to_inference_seconds", file_path, "Trigger until the inference result is logged")
+        extra = {"TraceId": trace_id} if trace_id else {}
+        if timeline:
+            extra["Timeline"] = timeline["segments"]
+        log_entry = get_event_log(INFERENCE_LOG_FILE).write_inference(file_path, result, **extra)
+        logging.info(f"[Log] Inference result saved: {log_entry['Result']}")
+        enqueue_result(log_entry)  # the dashboard shows the result (and timeline) next to the clip
 
     def save_warnings_to_json(self):
-        warnings = get_system_warnings()
+        # Reads the monitor's latest snapshot; nothing here blocks or touches the camera
+        health = self.health.snapshot()
+        warnings = list(health["warnings"])
+        for source in self.warning_sources:
+            warnings += source()
         filename = os.path.join(WARNING_JSON_DIR, "system_warnings.json")
         with open(filename, "w") as f:
-            json.dump({"warnings": warnings}, f, indent=4)
+            json.dump({"warnings": warnings, "health": health}, f, indent=4)
         logging.info(f"Warnings saved to {filename}")
+        if warnings and warnings != self.last_warnings:
+            get_event_log(WARNING_LOG_FILE).write_warnings(warnings, Timestamp=health["timestamp"])
+        self.last_warnings = warnings
 
     def start_warning_monitor(self):
         while True:
@@ -159,7 +383,8 @@ class RecorderModule:
 
 if __name__ == "__main__":
     recorder = RecorderModule()
-    sensor_thread = threading.Thread(target=start_sensor, args=(recorder.queue_file,handle_amplitude()), daemon=True)
+    sensor_thread = threading.Thread(target=start_sensor, kwargs={"on_amplitude_callback": recorder.handle_amplitude,
+                                                                  "is_backlogged": recorder.is_backlogged}, daemon=True)
     sensor_thread.start()
     while True:
         time.sleep(1)
@@ -0,0 +1,107 @@
+import os
+import queue
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_ENABLED = True    # Build a low-bitrate preview rendition for every MP4 upload
+TRANSCODE_WORKERS = 1       # Transcodes are CPU heavy; keep them off the request threads
+TRANSCODE_QUEUE_SIZE = 256
+RENDITION_DIR = "renditions"  # Sub-folder of the upload folder
+PREVIEW_HEIGHT = 360
+PREVIEW_CRF = 30
+PREVIEW_MAXRATE = "600k"
+PREVIEW_AUDIO_BITRATE = "64k"
+
+def rendition_name(video_filename):
+    return f"{os.path.splitext(video_filename)[0]}_preview.mp4"
+
+def transcode_preview(video_path, output_path):
+    """
+    Writes a small H.264/AAC rendition with the moov atom up front (+faststart), so
+    browsers can start playback and seek with range requests before the whole file arrives.
+    """
+    tmp_path = output_path + ".part"
+    try:
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-i', video_path,
+             '-vf', f"scale=-2:'min({PREVIEW_HEIGHT},ih)'",
+             '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(PREVIEW_CRF),
+             '-maxrate', PREVIEW_MAXRATE, '-bufsize', '1200k', '-pix_fmt', 'yuv420p',
+             '-c:a', 'aac', '-b:a', PREVIEW_AUDIO_BITRATE,
+             '-movflags', '+faststart', '-f', 'mp4', tmp_path],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=600
+        )
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error: {e.stderr.decode()}")
+        return False
+    except subprocess.TimeoutExpired:
+        logger.error(f"FFmpeg timed out transcoding {video_path}")
+        return False
+    except OSError as e:
+        logger.error(f"Could not run FFmpeg: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_path) and not os.path.getsize(tmp_path):
+            os.remove(tmp_path)
+    if not os.path.exists(tmp_path):
+        return False
+    os.replace(tmp_path, output_path)  # never expose a half-written rendition
+    logger.info(f"Preview rendition generated: {output_path}")
+    return True
+
+
+class Transcoder:
+    """Bounded background pool that builds preview renditions after upload."""
+
+    def __init__(self, catalog, upload_folder, workers=TRANSCODE_WORKERS,
+                 queue_size=TRANSCODE_QUEUE_SIZE, enabled=TRANSCODE_ENABLED):
+        self.catalog = catalog
+        self.upload_folder = upload_folder
+        self.output_dir = os.path.join(upload_folder, RENDITION_DIR)
+        self.enabled = enabled
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.queued = set()
+        self.lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        if enabled:
+            for i in range(workers):
+                threading.Thread(target=self._worker, name=f"transcoder-{i}", daemon=True).start()
+
+    def rendition_path(self, video_filename):
+        return os.path.join(self.output_dir, rendition_name(video_filename))
+
+    def enqueue(self, video_id, video_filename):
+        if not self.enabled:
+            return False
+        with self.lock:
+            if video_filename in self.queued:
+                return True
+            try:
+                self.jobs.put_nowait((video_id, video_filename))
+            except queue.Full:
+                logger.warning(f"Transcode queue full; {video_filename} is served at original quality.")
+                return False
+            self.queued.add(video_filename)
+            return True
+
+    def _worker(self):
+        while True:
+            video_id, video_filename = self.jobs.get()
+            try:
+                output_path = self.rendition_path(video_filename)
+                if not os.path.exists(output_path):
+                    video_path = os.path.join(self.upload_folder, video_filename)
+                    if not transcode_preview(video_path, output_path):
+                        # Recorded so playback stops asking for this clip to be transcoded again
+                        self.catalog.update(video_id, rendition_failed=1)
+                        continue
+                self.catalog.update(video_id, rendition=os.path.basename(output_path), rendition_failed=0)
+            except Exception as e:
+                logger.error(f"Transcode job failed for {video_filename}: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(video_filename)
+                self.jobs.task_done()
@@ -0,0 +1,235 @@
+import os
+import time
+import heapq
+import shutil
+import logging
+import threading
+
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+RECORDING_EXTENSIONS = ('.mp4', '.avi', '.wav')
+HIGH_WATERMARK = 0.90       # Start evicting above this fraction of max_bytes...
+LOW_WATERMARK = 0.80        # ...and stop once usage is back under this fraction
+MIN_FREE_MB = 100           # Volume free-space floor that also triggers eviction
+TARGET_FREE_MB = 300        # Free space to reach once the floor is hit
+SWEEP_INTERVAL = 600        # seconds between age sweeps
+
+# Eviction order: lowest class first, oldest first within a class
+CLASS_NO_ACTIVITY = 0   # Inference found nothing suspicious
+CLASS_UPLOADED = 1      # Suspicious, but already on the server
+CLASS_PENDING = 2       # Not inferred yet
+CLASS_SUSPICIOUS = 3    # Suspicious and only stored here
+
+def eviction_class(label, uploaded):
+    if label is not None and "No suspicious activity" in label:
+        return CLASS_NO_ACTIVITY
+    if uploaded:
+        return CLASS_UPLOADED
+    if label is None:
+        return CLASS_PENDING
+    return CLASS_SUSPICIOUS
+
+
+class RetentionManager:
+    """
+    In-memory index of the recordings folder with priority eviction.
+
+    The folder is scanned once; afterwards the index is kept current from watchdog
+    events (add/remove) and from inference/upload results (set_label/mark_uploaded).
+    Eviction candidates sit in a heap keyed by (class, mtime), so each deletion is
+    O(log n) and never lists or stats the folder again. Stale heap entries left by
+    re-classification are skipped lazily via a per-file version number.
+    """
+
+    def __init__(self, directory, max_bytes=None, max_age_days=None, high_watermark=HIGH_WATERMARK,
+                 low_watermark=LOW_WATERMARK, min_free_mb=MIN_FREE_MB, target_free_mb=TARGET_FREE_MB,
+                 sweep_interval=SWEEP_INTERVAL):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self.target_free_bytes = max(target_free_mb, min_free_mb) * 1024 * 1024
+        self.sweep_interval = sweep_interval
+        self.lock = threading.RLock()
+        self.entries = {}   # path -> {"size", "mtime", "label", "uploaded", "version"}
+        self.heap = []      # (class, mtime, version, path)
+        self.total_bytes = 0
+        self.thread = None
+        os.makedirs(self.directory, exist_ok=True)
+        self.scan()
+
+    def configure(self, **settings):
+        with self.lock:
+            for name, value in settings.items():
+                if name in ("min_free_mb", "target_free_mb"):
+                    setattr(self, name.replace("_mb", "_bytes"), value * 1024 * 1024)
+                elif value is not None:
+                    setattr(self, name, value)
+
+    # -----------------------------
+    # INDEX
+    # -----------------------------
+    def scan(self):
+        """One pass over the folder to seed the index (startup only)."""
+        with self.lock:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.lower().endswith(RECORDING_EXTENSIONS):
+                        st = entry.stat()
+                        self._index(entry.path, st.st_size, st.st_mtime)
+        logger.info(f"[Retention] Indexed {len(self.entries)} recording(s), {self.total_bytes / 1e6:.1f} MB.")
+
+    def _index(self, path, size, mtime, label=None, uploaded=False):
+        old = self.entries.get(path)
+        if old is not None:
+            self.total_bytes -= old["size"]
+            label = label if label is not None else old["label"]
+            uploaded = uploaded or old["uploaded"]
+        version = old["version"] + 1 if old else 0
+        self.entries[path] = {"size": size, "mtime": mtime, "label": label, "uploaded": uploaded, "version": version}
+        self.total_bytes += size
+        heapq.heappush(self.heap, (eviction_class(label, uploaded), mtime, version, path))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            # Drop stale entries left behind by re-classification
+            self.heap = [item for item in self.heap
+                         if item[3] in self.entries and self.entries[item[3]]["version"] == item[2]]
+            heapq.heapify(self.heap)
+
+    def add(self, path):
+        """A recording was written (watchdog on_closed)."""
+        path = str(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            self._index(path, st.st_size, st.st_mtime)
+        self.enforce()
+
+    def remove(self, path):
+        """A recording disappeared (watchdog on_deleted or deleted elsewhere)."""
+        with self.lock:
+            entry = self.entries.pop(str(path), None)
+            if entry is not None:
+                self.total_bytes -= entry["size"]
+
+    def _reclassify(self, path, **changes):
+        with self.lock:
+            entry = self.entries.get(str(path))
+            if entry is None:
+                return
+            self._index(str(path), entry["size"], entry["mtime"], **changes)
+
+    def set_label(self, path, label):
+        self._reclassify(path, label=label)
+
+    def mark_uploaded(self, path):
+        self._reclassify(path, uploaded=True)
+
+    # -----------------------------
+    # EVICTION
+    # -----------------------------
+    def _pop_candidate(self):
+        while self.heap:
+            _, _, version, path = heapq.heappop(self.heap)
+            entry = self.entries.get(path)
+            if entry is not None and entry["version"] == version:
+                return path, entry
+        return None, None
+
+    def _delete(self, path, entry, reason):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"[Retention] Could not delete {path}: {e}")
+            return 0
+        self.entries.pop(path, None)
+        self.total_bytes -= entry["size"]
+        counter("retention_deleted_total", "Recordings deleted by the retention manager").inc()
+        logger.info(f"[Retention] Deleted {path} ({reason}, {entry['size'] / 1e6:.1f} MB, label: {entry['label']})")
+        return entry["size"]
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.directory).free
+
+    def enforce(self):
+        """
+        Evicts while over the high watermark (of max_bytes or of the volume's free-space floor)
+        until usage falls under the low watermark. Returns the number of files deleted.
+        """
+        with self.lock:
+            free = self.free_bytes()
+            over_quota = self.max_bytes is not None and self.total_bytes > self.high_watermark * self.max_bytes
+            low_space = free < self.min_free_bytes
+            if not over_quota and not low_space:
+                return 0
+            target_total = self.low_watermark * self.max_bytes if self.max_bytes is not None else float("inf")
+            deleted = 0
+            while self.total_bytes > target_total or (low_space and free < self.target_free_bytes):
+                path, entry = self._pop_candidate()
+                if path is None:
+                    logger.warning("[Retention] Nothing left to delete, but space is still low.")
+                    break
+                freed = self._delete(path, entry, "low space" if low_space else "quota")
+                free += freed
+                deleted += 1 if freed else 0
+            return deleted
+
+    def ensure_free(self, min_free_mb=None):
+        """Called right before a recording starts; cheap when there is enough space."""
+        if min_free_mb is not None:
+            self.configure(min_free_mb=min_free_mb)
+        return self.enforce()
+
+    def sweep(self):
+        """Deletes recordings older than max_age_days, then re-checks the watermarks."""
+        deleted = 0
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            with self.lock:
+                expired = [(p, e) for p, e in self.entries.items() if e["mtime"] < cutoff]
+                for path, entry in expired:
+                    deleted += 1 if self._delete(path, entry, "age") else 0
+        return deleted + self.enforce()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._sweep_loop, name="retention", daemon=True)
+            self.thread.start()
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"[Retention] Sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "heap": len(self.heap)}
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_retention_manager(directory, **settings):
+    """
+    Returns the process-wide manager for directory, creating it on first use.
+    Settings passed to later calls update the existing manager.
+    """
+    key = os.path.realpath(str(directory))
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = RetentionManager(directory, **settings)
+        elif settings:
+            manager.configure(**settings)
+        return manager
@@ -1,35 +1,348 @@
 import requests
 import os
+import json
+import time
+import uuid
+import heapq
+import random
 import logging
+import threading
+from requests.adapters import HTTPAdapter
+from metrics import histogram, counter, observe_since_trigger
 
 # Initialize logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def send_file(file_path):
+# Change to your laptop's IP address (or set UPLOAD_SERVER_URL)
+SERVER_URL = os.environ.get("UPLOAD_SERVER_URL", "http://192.168.24.1:5001/upload")
+# Inference results (JSON) go to the server's /upload_json next to /upload
+RESULT_URL = os.environ.get("RESULT_SERVER_URL", SERVER_URL.rsplit("/", 1)[0] + "/upload_json")
+OUTBOX_DIR = os.environ.get("UPLOAD_OUTBOX_DIR", "/home/admin/pi/outbox")
+UPLOAD_WORKERS = 2          # Max concurrent uploads
+OUTBOX_MAX_ENTRIES = 500    # Oldest pending uploads are dropped beyond this
+UPLOAD_MAX_ATTEMPTS = 10
+RETRY_BASE_DELAY = 2        # seconds, doubled per attempt
+RETRY_MAX_DELAY = 300       # seconds
+UPLOAD_TIMEOUT = (5, 60)    # (connect, read) seconds
+CHUNK_SIZE = 64 * 1024
+
+
+class MultipartFileStream:
     """
-    Sends a single file from the Raspberry Pi to the laptop using HTTP.
-    :param file_path: Full path of the file to send.
+    File-like multipart/form-data body for a single file field.
+    requests reads it in CHUNK_SIZE pieces, so the file is streamed from disk rather
+    than loaded into memory, and `len` lets it send a normal Content-Length header.
+    """
+
+    def __init__(self, file_path, field_name="file", chunk_size=CHUNK_SIZE):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        file_name = os.path.basename(file_path)
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.len = len(self.head) + os.path.getsize(file_path) + len(self.tail)
+        self.bytes_read = 0
+        self._file = None
+        self._stage = 0  # 0 = head, 1 = file, 2 = tail, 3 = done
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        data = b""
+        while len(data) < size and self._stage < 3:
+            if self._stage == 0:
+                data += self.head
+                self._file = open(self.file_path, "rb")
+                self._stage = 1
+            elif self._stage == 1:
+                chunk = self._file.read(size - len(data))
+                if chunk:
+                    data += chunk
+                else:
+                    self._file.close()
+                    self._stage = 2
+            else:
+                data += self.tail
+                self._stage = 3
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Uploader:
+    """
+    Background uploader with a persistent connection pool.
+
+    enqueue() records the upload in an on-disk outbox (a small JSON file per entry
+    pointing at the clip) and returns immediately. A fixed pool of worker threads
+    streams files to the server over one requests.Session, retrying failures with
+    exponential backoff and jitter. Pending entries survive restarts.
+    """
+
+    def __init__(self, url=SERVER_URL, outbox_dir=OUTBOX_DIR, workers=UPLOAD_WORKERS,
+                 max_entries=OUTBOX_MAX_ENTRIES, max_attempts=UPLOAD_MAX_ATTEMPTS):
+        self.url = url
+        self.outbox_dir = outbox_dir
+        self.workers = workers
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.heap = []  # (next_attempt, entry_id)
+        self.entries = {}
+        self.cond = threading.Condition()
+        self.stats = {"uploaded": 0, "failed": 0, "dropped": 0, "retries": 0,
+                      "bytes_sent": 0, "upload_seconds": 0.0}
+        self.threads = []
+        self.listeners = []  # callables invoked with the path of each successful upload
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        self._load_outbox()
+        if self.entries:
+            self.start()  # resumed uploads must not wait for the next enqueue
+
+    # -----------------------------
+    # OUTBOX
+    # -----------------------------
+    def _entry_path(self, entry_id):
+        return os.path.join(self.outbox_dir, f"{entry_id}.json")
+
+    def _save_entry(self, entry):
+        tmp = self._entry_path(entry["id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._entry_path(entry["id"]))
+
+    def _remove_entry(self, entry_id):
+        self.entries.pop(entry_id, None)
+        try:
+            os.remove(self._entry_path(entry_id))
+        except FileNotFoundError:
+            pass
+
+    def _load_outbox(self):
+        for name in os.listdir(self.outbox_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.outbox_dir, name)) as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                os.remove(os.path.join(self.outbox_dir, name))
+                continue
+            self.entries[entry["id"]] = entry
+            heapq.heappush(self.heap, (entry["next_attempt"], entry["id"]))
+        if self.entries:
+            logger.info(f"[Upload] Resuming {len(self.entries)} pending upload(s) from outbox.")
+
+    def enqueue(self, file_path, url=None):
+        """Schedules file_path for upload and returns without waiting."""
+        return self._enqueue({"path": str(file_path), "url": url or self.url})
+
+    def _enqueue(self, entry):
+        entry.update(id=f"{time.time():.6f}-{uuid.uuid4().hex[:8]}", attempts=0, next_attempt=time.time())
+        with self.cond:
+            while len(self.entries) >= self.max_entries:
+                oldest = min(self.entries)
+                logger.error(f"[Upload] Outbox full, dropping {self.entries[oldest]['path']}")
+                self._remove_entry(oldest)
+                self.stats["dropped"] += 1
+            self._save_entry(entry)
+            self.entries[entry["id"]] = entry
+            heapq.heappush(self.heap, (entry["next_attempt"], entry["id"]))
+            self.cond.notify()
+        self.start()
+        return entry["id"]
+
+    def enqueue_json(self, payload, url=RESULT_URL):
+        """Schedules a JSON POST (e.g. an inference result) with the same outbox and retries as files."""
+        return self._enqueue({"path": f"{payload.get('File', 'json')} (result)", "json": payload, "url": url})
+
+    def pending(self):
+        with self.cond:
+            return len(self.entries)
+
+    # -----------------------------
+    # WORKERS
+    # -----------------------------
+    def start(self):
+        with self.cond:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"uploader-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _next_entry(self):
+        with self.cond:
+            while True:
+                # Skip heap items whose entry was dropped or already taken
+                while self.heap and self.heap[0][1] not in self.entries:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                next_attempt, entry_id = self.heap[0]
+                delay = next_attempt - time.time()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+                entry = self.entries[entry_id]
+                if entry.get("in_flight"):
+                    continue
+                entry["in_flight"] = True
+                return entry
+
+    def _worker(self):
+        while True:
+            entry = self._next_entry()
+            ok, retry = self._upload(entry)
+            with self.cond:
+                entry.pop("in_flight", None)
+                if ok:
+                    self._remove_entry(entry["id"])
+                    self.stats["uploaded"] += 1
+                elif not retry or entry["attempts"] + 1 >= self.max_attempts:
+                    logger.error(f"[Upload] Giving up on {entry['path']} after {entry['attempts'] + 1} attempt(s).")
+                    self._remove_entry(entry["id"])
+                    self.stats["failed"] += 1
+                else:
+                    entry["attempts"] += 1
+                    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** entry["attempts"]))
+                    delay *= random.uniform(0.5, 1.5)  # jitter so retries don't arrive in lockstep
+                    entry["next_attempt"] = time.time() + delay
+                    self._save_entry({k: v for k, v in entry.items() if k != "in_flight"})
+                    heapq.heappush(self.heap, (entry["next_attempt"], entry["id"]))
+                    self.stats["retries"] += 1
+                    logger.warning(f"[Upload] Retry {entry['attempts']} for {entry['path']} in {delay:.1f}s")
+                    self.cond.notify()
+            if ok and "json" not in entry:
+                for listener in self.listeners:
+                    try:
+                        listener(entry["path"])
+                    except Exception as e:
+                        logger.error(f"[Upload] Listener failed for {entry['path']}: {e}")
+
+    def add_listener(self, callback):
+        """Registers callback(path), called from a worker thread after each successful upload."""
+        self.listeners.append(callback)
+
+    def _upload(self, entry):
+        """Returns (success, retryable)."""
+        if "json" in entry:
+            return post_json(self.session, entry["json"], entry["url"])
+        file_path = entry["path"]
+        if not os.path.exists(file_path):
+            logger.error(f"File {file_path} does not exist.")
+            return False, False
+        ok, retryable, sent, elapsed = upload_file(self.session, file_path, entry["url"])
+        with self.cond:
+            self.stats["bytes_sent"] += sent
+            self.stats["upload_seconds"] += elapsed
+        return ok, retryable
+
+    def get_stats(self):
+        with self.cond:
+            stats = dict(self.stats)
+            stats["pending"] = len(self.entries)
+        seconds = stats["upload_seconds"]
+        stats["throughput_bps"] = stats["bytes_sent"] / seconds if seconds else 0.0
+        return stats
+
+
+def upload_file(session, file_path, url):
+    """
+    Streams one file to the server over session.
+    Returns (success, retryable, bytes_sent, seconds).
     """
-    laptop_ip = 'http://192.168.24.1:5001/upload'  # Change to your laptop's IP address
     file_name = os.path.basename(file_path)
+    body = MultipartFileStream(file_path)
+    start = time.monotonic()
+    try:
+        response = session.post(url, data=body, headers={"Content-Type": body.content_type},
+                                timeout=UPLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        counter("upload_errors_total", "Uploads that failed with a connection error or bad status").inc()
+        logger.error(f"Error sending file {file_name}: {str(e)}")
+        return False, True, body.bytes_read, time.monotonic() - start
+    finally:
+        body.close()
+    elapsed = time.monotonic() - start
+    histogram("upload_seconds", "send_file HTTP upload of one clip").observe(elapsed)
+    counter("upload_bytes_total", "Bytes sent to the server").inc(body.bytes_read)
+    if response.status_code == 200:
+        logger.info(f"File {file_name} sent successfully!")
+        observe_since_trigger("trigger_to_upload_seconds", file_name, "Trigger until the server accepted the clip")
+        return True, False, body.bytes_read, elapsed
+    counter("upload_errors_total", "Uploads that failed with a connection error or bad status").inc()
+    logger.error(f"Failed to send file {file_name}. Response: {response.text}")
+    # Client errors other than timeouts/rate limiting won't succeed on retry
+    retryable = response.status_code >= 500 or response.status_code in (408, 429)
+    return False, retryable, body.bytes_read, elapsed
+
+
+def post_json(session, payload, url):
+    """POSTs one JSON document. Returns (success, retryable)."""
+    try:
+        response = session.post(url, json=payload, timeout=UPLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f"Error sending result for {payload.get('File')}: {e}")
+        return False, True
+    if response.status_code == 200:
+        return True, False
+    logger.error(f"Failed to send result for {payload.get('File')}. Response: {response.text}")
+    return False, response.status_code >= 500 or response.status_code in (408, 429)
+
 
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def get_uploader():
+    """Returns the process-wide Uploader, creating it on first use."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = Uploader()
+        return _uploader
+
+def enqueue_file(file_path):
+    """Queues a file for background upload and returns immediately."""
+    return get_uploader().enqueue(file_path)
+
+def enqueue_result(entry):
+    """Queues an inference result ({"File", "Result", "Timestamp", ...}) for the dashboard."""
+    return get_uploader().enqueue_json(entry)
+
+def send_file(file_path):
+    """
+    Sends a single file from the Raspberry Pi to the laptop using HTTP, synchronously.
+    :param file_path: Full path of the file to send.
+    :return: True if the server accepted the file.
+    """
     # Check if the file exists
     if not os.path.exists(file_path):
         logger.error(f"File {file_path} does not exist.")
-        return
-
-    # Open the file and send it via HTTP POST
-    try:
-        with open(file_path, 'rb') as file:
-            response = requests.post(laptop_ip, files={'file': (file_name, file)})
-            if response.status_code == 200:
-                logger.info(f"File {file_name} sent successfully!")
-            else:
-                logger.error(f"Failed to send file {file_name}. Response: {response.text}")
-    except Exception as e:
-        logger.error(f"Error sending file {file_name}: {str(e)}")
+        return False
+    ok, _, _, _ = upload_file(get_uploader().session, file_path, SERVER_URL)
+    return ok
 
-# Test with specific files
-send_file("C:/Users/Sujan/Downloads/send_files/test.mp4")
-send_file("C:/Users/Sujan/Downloads/send_files/test.json")
+if __name__ == "__main__":
+    # Test with specific files
+    send_file("C:/Users/Sujan/Downloads/send_files/test.mp4")
+    send_file("C:/Users/Sujan/Downloads/send_files/test.json")
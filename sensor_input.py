@@ -1,21 +1,24 @@
 #!/usr/bin/env python3
 import cv2
-import numpy as np
-import pyaudio
 import wave
 import time
 import os
-import shutil
-import subprocess
 import queue
-import json
+from capture_pipeline import CapturePipeline
+from motion_detector import create_detector, draw_motion
+from audio_monitor import AudioMonitor, ReplayAudioMonitor, wav_format
+from event_log import get_event_log
+from health_monitor import get_health_monitor, HEALTH_SAMPLE_HZ
+from metrics import histogram, counter, new_trace_id, trace_filename_suffix
+from retention import get_retention_manager
 
 # -----------------------------
 # USER CONFIGURATIONS
 # -----------------------------
 OUTPUT_DIR = "/home/admin/pi/recordings"
 MIN_FREE_MB = 100  # If less than this free, delete oldest files
-RECORD_DURATION = 10  # seconds
+RECORD_DURATION = 10  # seconds recorded after the last trigger
+PRE_ROLL_SECONDS = 5  # seconds kept in memory and prepended to each clip
 
 # Audio settings for *detection only* (via pyaudio)
 AUDIO_CHUNK = 512
@@ -23,18 +26,22 @@ AUDIO_RATE = 48000
 AUDIO_CHANNELS = 1
 AUDIO_THRESHOLD = 25000  # Peak amplitude threshold for "loud noise"
 AUDIO_DEVICE_INDEX = None   # Use Default Audio device index (for detection)
+AUDIO_WINDOW_MS = 50  # Peak/RMS metering window (half-window hop)
 
 # Motion detection
-MOTION_AREA_THRESHOLD = 8000  # Contour area threshold for motion
+MOTION_AREA_THRESHOLD = 8000  # Contour area threshold for motion (full-resolution pixels)
+MOTION_METHOD = "running_average"  # "running_average", "mog2" or "framediff" (original)
+MOTION_SCALE = 0.25  # Detection runs on a frame downscaled by this factor
+MOTION_MAX_SKIP = 3  # Max frames skipped between detections while the scene is idle
+MOTION_IGNORE_POLYGONS = []  # e.g. [[(0, 0), (200, 0), (200, 150), (0, 150)]] to ignore a window
+SHOW_PREVIEW = False  # Show the "Motion Detection" window (needs a display)
 
 # Video capture settings (for detection)
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
 FPS = 30  
-FRAME_BUFFER_SIZE = 100  
+FRAME_BUFFER_SIZE = 2  # Frames waiting for the health monitor (it only needs the newest)
 
-# Which ALSA device to use for ffmpeg (replace with your device if needed)
-FFMPEG_ALSA_DEVICE = "plughw:CARD=Webcam,DEV=0"
 #Alerts variable
 LOW_BRIGHTNESS_THRESHOLD = 50
 LOW_CONTRAST_THRESHOLD = 10
@@ -44,7 +51,7 @@ BLUR_THRESHOLD = 100
 # Motion detection pause flag
 motion_paused = False
 #JSON
-WARNING_LOG_FILE = "/home/admin/pi/log.json"
+WARNING_LOG_FILE = "/home/admin/pi/log.jsonl"
 # -----------------------------
 # SHARED FRAME QUEUE FOR ALERT DETECTION
 # -----------------------------
@@ -55,284 +62,223 @@ event_log = []
 # HELPER FUNCTIONS
 # -----------------------------
 
-def get_free_space_mb(directory="/"):
-    """Returns free disk space in MB for the given directory."""
-    stat = shutil.disk_usage(directory)
-    free_mb = stat.free / (1024 * 1024)
-    return free_mb
+def ensure_space(output_dir=None):
+    """
+    Makes sure the recordings volume has at least MIN_FREE_MB free before a clip starts.
+    Uses the shared retention index, so it only deletes from an in-memory heap
+    (unimportant and already-uploaded clips first) instead of listing and sorting the folder.
+    """
+    get_retention_manager(output_dir or OUTPUT_DIR).ensure_free(MIN_FREE_MB)
 
-def ensure_space():
+def camera_settings(camera=None):
     """
-    Checks if there's enough free space. If less than MIN_FREE_MB,
-    deletes oldest files until enough space is freed.
+    Settings for one detection loop: the module defaults above, overridden by the
+    keys of camera (as configured for camera_manager). "source" may be a camera
+    index, a /dev/videoN node, a video file or a stream URL.
     """
-    while get_free_space_mb("/") < MIN_FREE_MB:
-        files = [
-            os.path.join(OUTPUT_DIR, f)
-            for f in os.listdir(OUTPUT_DIR)
-            if f.lower().endswith(('.mp4', '.avi', '.wav'))
-        ]
-        # Sort by oldest first
-        files.sort(key=os.path.getmtime)
-        
-        if not files:
-            print("No files left to delete, but space is still low.")
-            return
-        
-        oldest_file = files[0]
-        print(f"Deleting {oldest_file} to free space...")
-        os.remove(oldest_file)
-        # -----------------------------
+    settings = {
+        "name": None,
+        "source": 0,
+        "output_dir": OUTPUT_DIR,
+        "width": FRAME_WIDTH,
+        "height": FRAME_HEIGHT,
+        "fps": FPS,
+        "loop": False,
+        "speed": 1.0,  # playback speed of file sources (and audio_file)
+        "pre_roll_seconds": PRE_ROLL_SECONDS,
+        "record_duration": RECORD_DURATION,
+        "motion_area_threshold": MOTION_AREA_THRESHOLD,
+        "motion_method": MOTION_METHOD,
+        "motion_scale": MOTION_SCALE,
+        "motion_max_skip": MOTION_MAX_SKIP,
+        "motion_ignore_polygons": MOTION_IGNORE_POLYGONS,
+        "audio": True,
+        "audio_device_index": AUDIO_DEVICE_INDEX,
+        "audio_threshold": AUDIO_THRESHOLD,
+        "audio_file": None,  # 16-bit WAV replayed instead of the microphone
+        "show_preview": SHOW_PREVIEW,
+    }
+    unknown = set(camera or {}) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown camera setting(s): {', '.join(sorted(unknown))}")
+    settings.update(camera or {})
+    return settings
+
+# -----------------------------
 # FUNCTION: CHECK VIDEO WARNINGS
 # -----------------------------
 def get_video_warnings():
-    cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
-    if not cap.isOpened():
-        return ["Camera not accessible"]
-
-    ret, frame = cap.read()
-    cap.release()
-    if not ret:
-        return ["Camera frame not available"]
-
-    warnings = []
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-    brightness = np.mean(gray)
-    if brightness < LOW_BRIGHTNESS_THRESHOLD:
-        warnings.append("Low brightness detected")
-
-    contrast = gray.std()
-    if contrast < LOW_CONTRAST_THRESHOLD:
-        warnings.append("Low contrast detected")
-
-    noise = np.var(gray)
-    if noise > HIGH_NOISE_THRESHOLD:
-        warnings.append("High noise detected")
-
-    if np.all(gray < 10):
-        warnings.append("Camera might be obstructed or turned off")
-
-    blur_value = cv2.Laplacian(gray, cv2.CV_64F).var()
-    if blur_value < BLUR_THRESHOLD:
-        warnings.append("Blurry video detected")
-
+    """
+    Current camera warnings from the health monitor, which analyses the frames the
+    detection loop already captures (the camera is not opened a second time).
+    """
+    warnings = get_health_monitor(frame_queue).video_warnings()
     log_warnings_to_json(warnings)
-
     return warnings
 
 def log_warnings_to_json(warnings):
-    """Logs detected warnings into a JSON file."""
+    """Appends detected warnings to the JSON Lines warning log."""
     if not warnings:
         return  # No warnings, skip logging
 
-    data = []
-
-    # Ensure JSON file exists
-    if os.path.exists(WARNING_LOG_FILE):
-        try:
-            with open(WARNING_LOG_FILE, "r") as f:
-                data = json.load(f)
-        except json.JSONDecodeError:
-            print("[Warning] Resetting corrupted JSON file.")
-            data = []  # Reset corrupted file
-
-    # Append new warnings with timestamp
-    new_entry = {
-        "Timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "Warnings": warnings
-    }
-    data.append(new_entry)
-
-    # Save back to JSON
-    with open(WARNING_LOG_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
+    new_entry = get_event_log(WARNING_LOG_FILE).write_warnings(warnings)
     print(f"[Log] Warnings saved: {new_entry}")
 
-def detect_loud_noise(stream, threshold, on_loud_detected=None):
-    try:
-        data = stream.read(AUDIO_CHUNK, exception_on_overflow=False)
-    except OSError as e:
-        return False, 0
-
-    if len(data) < 2:
-        return False, 0
-
-    audio_data = np.frombuffer(data, dtype=np.int16)
-    peak_amplitude = np.max(np.abs(audio_data))
-    is_loud = peak_amplitude > threshold
-
-    # Trigger callback if set
-    if is_loud and callable(on_loud_detected):
-        try:
-            on_loud_detected(peak_amplitude)
-        except Exception as e:
-            print(f"[Error] Callback failed: {e}")
-
-
-    return is_loud, peak_amplitude
-
-def record_with_ffmpeg(duration=5):
+def poll_loud_noise(audio_monitor, on_loud_detected=None):
+    """Drains loud-noise events from the AudioMonitor without blocking. Returns True if any."""
+    events = audio_monitor.poll()
+    for event in events:
+        if callable(on_loud_detected):
+            try:
+                on_loud_detected(event.peak)
+            except Exception as e:
+                print(f"[Error] Callback failed: {e}")
+    return bool(events)
+
+def new_recording_filename(trace_id=None, output_dir=None, camera_name=None):
     """
-    Uses ffmpeg in a subprocess to record both audio and video for 'duration' seconds,
-    storing the final file in OUTPUT_DIR.
+    Returns a timestamped MP4 path inside output_dir (default OUTPUT_DIR). The trace id,
+    when given, is embedded in the name so every later stage (and the server) can
+    attribute latency to it; the camera name, when given, tells clips from several cameras apart.
     """
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = os.path.join(OUTPUT_DIR, f"record_{timestamp}.mp4")
-
-    # Example ffmpeg command:
-    #   - Capture video from /dev/video0
-    #   - Capture audio from the ALSA device (set via FFMPEG_ALSA_DEVICE)
-    #   - Limit to 'duration' seconds via -t
-    #   - Save to MP4 (H.264 video, AAC audio)
-    cmd = [
-        "ffmpeg",
-        "-y",  # Overwrite if file exists
-        "-f", "v4l2",
-        "-thread_queue_size", "1024",
-        "-s", f"{FRAME_WIDTH}x{FRAME_HEIGHT}",  # frame size
-        "-i", "/dev/video0",  # Adjust if your webcam is on another device
-        "-f", "alsa",
-        "-thread_queue_size", "1024",
-        "-i", FFMPEG_ALSA_DEVICE,  # ALSA input device
-        "-t", str(duration),       # Recording duration
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-c:a", "aac",
-        "-b:a", "128k",
-        filename
-    ]
-
-    print(f"Starting ffmpeg to record {duration} seconds...")
-    subprocess.run(cmd, check=False)
-    # Note: check=False so it doesn't crash on ffmpeg return code.
-    print(f"Saved recording: {filename}")
+    prefix = f"record_{camera_name}_" if camera_name else "record_"
+    suffix = trace_filename_suffix(trace_id) if trace_id else ""
+    return os.path.join(output_dir or OUTPUT_DIR, f"{prefix}{timestamp}{suffix}.mp4")
 
 # -----------------------------
 # MAIN LOOP
 # -----------------------------
-def main(on_amplitude_callback=None):
+def main(on_amplitude_callback=None, is_backlogged=None, camera=None, detection_interval=None,
+         reserve_space=ensure_space, stop=None):
+    """
+    Runs the detection loop for one source.
+
+    camera overrides the module settings (see camera_settings), so camera_manager can
+    run one loop per camera in its own process. is_backlogged, when given, is polled
+    before a new clip is started. While it returns True (inference has fallen behind),
+    motion alone does not start a new clip; loud noises still do, and a clip that is
+    already recording can still be extended. detection_interval, when given, returns
+    the minimum seconds between motion checks (0 = every frame) so detection can be
+    throttled while the CPU is needed for inference. reserve_space(output_dir) is
+    called before each new clip. The loop ends when the source ends or stop (a
+    threading.Event) is set.
+    """
     global motion_paused
+    cfg = camera_settings(camera)
+    output_dir = cfg["output_dir"]
+    label = f"[{cfg['name']}] " if cfg["name"] else ""
 
     # Ensure output directory exists
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-    #Run warnings
-    warnings = get_video_warnings()
-    if warnings:
-        print("Video Warnings:", warnings)
-
-    # Initialize video capture for motion detection only
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
-
-    if not cap.isOpened():
-        print("Error: Could not open video capture.")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    # Camera/system health is computed in the background from frames offered by this loop
+    health = get_health_monitor(frame_queue)
+    health.start()
+    health_interval = 1.0 / HEALTH_SAMPLE_HZ
+    next_health_frame = 0.0
+
+    audio_rate, audio_channels = wav_format(cfg["audio_file"]) if cfg["audio_file"] else (AUDIO_RATE, AUDIO_CHANNELS)
+
+    # Single persistent capture: frames feed motion detection and the pre-roll buffer
+    pipeline = CapturePipeline(cfg["source"], cfg["width"], cfg["height"], cfg["fps"],
+                               pre_roll_seconds=cfg["pre_roll_seconds"],
+                               audio_rate=audio_rate, audio_channels=audio_channels,
+                               loop=cfg["loop"], speed=cfg["speed"])
+    if not pipeline.start():
+        print(f"{label}Error: Could not open video capture ({cfg['source']}).")
         return
 
-    # Read two initial frames for motion detection
-    ret1, frame1 = cap.read()
-    ret2, frame2 = cap.read()
+    detector = create_detector(cfg["motion_method"], scale=cfg["motion_scale"], min_area=cfg["motion_area_threshold"],
+                               max_skip=cfg["motion_max_skip"], ignore_polygons=cfg["motion_ignore_polygons"])
 
-    if not ret1 or not ret2:
-        print("Error: Could not read initial frames from camera.")
-        cap.release()
+    ret, frame, seq = pipeline.read()
+    if not ret:
+        print(f"{label}Error: Could not read initial frames from camera.")
+        pipeline.stop()
         return
 
-    # Initialize audio stream for loud-noise detection
-    p = pyaudio.PyAudio()
-    audio_stream = p.open(format=pyaudio.paInt16,
-                          channels=AUDIO_CHANNELS,
-                          rate=AUDIO_RATE,
-                          input=True,
-                          input_device_index=AUDIO_DEVICE_INDEX,
-                          frames_per_buffer=AUDIO_CHUNK)
-
-    print("Starting main loop. Press 'q' in video window to quit.")
+    # Audio runs on its own callback stream; it also feeds the clip pre-roll
+    audio_monitor = None
+    if cfg["audio_file"]:
+        audio_monitor = ReplayAudioMonitor(cfg["audio_file"], speed=cfg["speed"], loop=cfg["loop"], chunk=AUDIO_CHUNK,
+                                           threshold=cfg["audio_threshold"], window_ms=AUDIO_WINDOW_MS,
+                                           on_audio_data=pipeline.push_audio)
+        audio_monitor.start()
+    elif cfg["audio"]:
+        audio_monitor = AudioMonitor(rate=AUDIO_RATE, channels=AUDIO_CHANNELS, chunk=AUDIO_CHUNK,
+                                     device_index=cfg["audio_device_index"], threshold=cfg["audio_threshold"],
+                                     window_ms=AUDIO_WINDOW_MS, on_audio_data=pipeline.push_audio)
+        audio_monitor.start()
+
+    loop_timer = histogram("detection_loop_seconds", "Detection loop iteration, excluding the wait for the next frame")
+    triggers = counter("recording_triggers_total", "Clips started by motion or loud noise")
+    shed = counter("recording_triggers_shed_total", "Detection iterations whose motion-only trigger was ignored (inference backlogged)")
+    backlogged = False
+    last_detection = 0.0
+
+    print(f"{label}Starting main loop. Press Ctrl+C (or 'q' in the preview window) to quit.")
 
     try:
-        while True:
+        while stop is None or not stop.is_set():
             if motion_paused:
-                # If we are paused (i.e., while recording), just wait
-                print("Motion detection paused. Waiting for recording to finish...")
+                # Detection can be paused externally; capture keeps running
+                print("Motion detection paused.")
+                if audio_monitor:
+                    audio_monitor.poll()  # drop loud-noise events raised while paused
                 time.sleep(1)
                 continue
 
-            # ---- MOTION DETECTION ----
-            diff = cv2.absdiff(frame1, frame2)
-            gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            blur = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
-            dilated = cv2.dilate(thresh, None, iterations=3)
-            contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+            iteration_start = time.perf_counter()
+
+            # ---- HEALTH SAMPLING ----
+            now = time.monotonic()
+            if now >= next_health_frame:
+                health.offer(frame)
+                next_health_frame = now + health_interval
 
+            # ---- MOTION DETECTION ----
             motion_detected = False
-            for contour in contours:
-                if cv2.contourArea(contour) < MOTION_AREA_THRESHOLD:
-                    continue
-                motion_detected = True
-                (x, y, w, h) = cv2.boundingRect(contour)
-                cv2.rectangle(frame1, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(frame1, "Movement", (10, 20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+            if detection_interval is None or now - last_detection >= detection_interval():
+                last_detection = now
+                motion = detector.detect(frame)
+                motion_detected = motion.detected
 
-            cv2.imshow("Motion Detection", frame1)
+                if cfg["show_preview"]:
+                    cv2.imshow(f"Motion Detection {cfg['name'] or ''}".strip(), draw_motion(frame, motion))
 
             # ---- AUDIO (LOUD NOISE) DETECTION ----
-            # audio_detected = detect_loud_noise(audio_stream, AUDIO_THRESHOLD)
-            audio_detected, peak_amplitude = detect_loud_noise(audio_stream, AUDIO_THRESHOLD, on_loud_detected=on_amplitude_callback)
-            # print(f"Peak Amplitude: {peak_amplitude} | Threshold: {AUDIO_THRESHOLD} | Pass to module")
-
+            audio_detected = audio_monitor is not None and poll_loud_noise(audio_monitor, on_loud_detected=on_amplitude_callback)
 
             # ---- TRIGGER RECORDING ----
+            # Detection keeps running while the clip is written; re-triggers extend it.
             if motion_detected or audio_detected:
-                print("Trigger! Recording for 10 seconds...")
-                ensure_space()
-
-                # 1) Close the detection audio stream so ffmpeg can use the mic
-                audio_stream.stop_stream()
-                audio_stream.close()
-                p.terminate()
-
-                # 2) **Release the webcam** so ffmpeg can grab /dev/video0
-                cap.release()
-
-                motion_paused = True
-                record_with_ffmpeg(RECORD_DURATION)
-                motion_paused = False
-                print("Recording complete.")
-
-                # 3) After ffmpeg finishes, **re-open** the webcam
-                cap = cv2.VideoCapture(0)
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
-
-                # Re-prime frames for motion detection
-                ret1, frame1 = cap.read()
-                ret2, frame2 = cap.read()
-
-                # 4) Re-open the PyAudio stream for detection
-                p = pyaudio.PyAudio()
-                audio_stream = p.open(format=pyaudio.paInt16,
-                                    channels=AUDIO_CHANNELS,
-                                    rate=AUDIO_RATE,
-                                    input=True,
-                                    input_device_index=AUDIO_DEVICE_INDEX,
-                                    frames_per_buffer=AUDIO_CHUNK)
-
-                continue
-
-
-            # Update frames for next iteration
-            frame1 = frame2
-            ret, frame2 = cap.read()
-            if not ret:
+                recording = pipeline.is_recording()
+                if not recording and callable(is_backlogged) and is_backlogged() != backlogged:
+                    backlogged = not backlogged
+                    print(f"{label}Inference backlogged: motion-only triggers paused." if backlogged
+                          else f"{label}Inference caught up: motion triggers resumed.")
+                if not recording and backlogged and not audio_detected:
+                    shed.inc()  # backpressure: don't start another clip for motion alone
+                    motion_detected = False
+            if motion_detected or audio_detected:
+                if not recording:
+                    reserve_space(output_dir)
+                trace_id = new_trace_id()
+                if pipeline.trigger(new_recording_filename(trace_id, output_dir, cfg["name"]), cfg["record_duration"]):
+                    triggers.inc()
+                    print(f"{label}Trigger! Recording {cfg['pre_roll_seconds']}s pre-roll + {cfg['record_duration']}s... (trace {trace_id})")
+            loop_timer.observe(time.perf_counter() - iteration_start)
+
+            # Wait for the next frame
+            ret, next_frame, seq = pipeline.read(seq)
+            if ret:
+                frame = next_frame
+            elif not pipeline.running:
                 break
 
             # Check for user exit
-            if cv2.waitKey(10) & 0xFF == ord('q'):
+            if cfg["show_preview"] and cv2.waitKey(1) & 0xFF == ord('q'):
                 print("Exiting main loop.")
                 break
 
@@ -340,11 +286,11 @@ def main(on_amplitude_callback=None):
         print("Interrupted by user.")
 
     # Cleanup
-    audio_stream.stop_stream()
-    audio_stream.close()
-    p.terminate()
-    cap.release()
-    cv2.destroyAllWindows()
+    if audio_monitor:
+        audio_monitor.stop()
+    pipeline.stop()
+    if cfg["show_preview"]:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,57 @@
+"""Verdicts of the in-process MP4 validator. "unknown" is what sends a clip to ffprobe."""
+import os
+import struct
+
+import pytest
+
+from mp4_probe import probe_mp4
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "mp4")
+
+
+def fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+@pytest.mark.parametrize("name, status, reason", [
+    ("valid.mp4", "valid", "ok"),
+    ("truncated_moov.mp4", "invalid", "truncated: moov box ends past end of file"),
+    ("truncated_mdat.mp4", "invalid", "truncated: mdat box ends past end of file"),
+    ("not_video.mp4", "invalid", "no leading ftyp box"),
+    ("empty.mp4", "invalid", "empty file"),
+    ("audio_only.mp4", "invalid", "no video track"),
+    ("fragmented.mp4", "unknown", "fragmented MP4"),
+])
+def test_fixture_verdicts(name, status, reason):
+    result = probe_mp4(fixture(name))
+    assert (result.status, result.reason) == (status, reason)
+
+
+def test_valid_clip_metadata():
+    result = probe_mp4(fixture("valid.mp4"))
+    assert result.codec == "avc1"
+    assert result.duration == pytest.approx(1.0)
+
+
+def test_trailing_bytes_are_invalid(tmp_path):
+    path = tmp_path / "trailing.mp4"
+    path.write_bytes(open(fixture("valid.mp4"), "rb").read() + b"\x00\x00\x00")
+    assert probe_mp4(str(path)) == ("invalid", "trailing bytes after the last box", None, None)
+
+
+def test_other_containers_are_left_to_ffprobe(tmp_path):
+    path = tmp_path / "clip.avi"
+    path.write_bytes(b"RIFF\x00\x00\x00\x00AVI ")
+    assert probe_mp4(str(path)).status == "unknown"
+    assert probe_mp4(str(path)).reason == "not an MP4 container"
+
+
+def test_quicktime_leading_box_is_left_to_ffprobe(tmp_path):
+    path = tmp_path / "clip.mov"
+    path.write_bytes(struct.pack(">I4s", 8, b"wide") + struct.pack(">I4s", 8, b"mdat"))
+    assert probe_mp4(str(path)).status == "unknown"
+    assert probe_mp4(str(path)).reason == "no leading ftyp box"
+
+
+def test_unreadable_file_is_left_to_ffprobe(tmp_path):
+    assert probe_mp4(str(tmp_path / "missing.mp4")).status == "unknown"
@@ -0,0 +1,128 @@
+"""Partial-content and conditional responses of /videos/<id> (httpServer.stream_video)."""
+import os
+import shutil
+import importlib
+
+import pytest
+
+pytest.importorskip("flask")
+
+SAMPLE_CLIP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "videos", "1.mp4")
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # httpServer creates its upload folder and catalog relative to the working directory on import
+    monkeypatch.chdir(tmp_path)
+    httpServer = importlib.import_module("httpServer")
+    from video_catalog import VideoCatalog
+    from renditions import Transcoder
+
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    catalog = VideoCatalog(str(tmp_path / "catalog.db"), str(upload_folder))
+    monkeypatch.setitem(httpServer.app.config, "UPLOAD_FOLDER", str(upload_folder))
+    monkeypatch.setattr(httpServer, "catalog", catalog)
+    # No worker threads: queued transcodes stay in the queue where the tests can see them
+    monkeypatch.setattr(httpServer, "transcoder", Transcoder(catalog, str(upload_folder), workers=0))
+
+    video_id, filename = catalog.allocate(".mp4", source_name="record_test.mp4")
+    shutil.copy(SAMPLE_CLIP, upload_folder / filename)
+    catalog.update(video_id, size=os.path.getsize(upload_folder / filename))
+    return httpServer, video_id, upload_folder / filename
+
+
+def test_range_request_returns_partial_content(server):
+    httpServer, video_id, path = server
+    size = os.path.getsize(path)
+    response = httpServer.app.test_client().get(f"/videos/{video_id}", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 0-99/{size}"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.data == path.read_bytes()[:100]
+    assert response.headers.get("ETag")
+
+
+def test_open_ended_range(server):
+    httpServer, video_id, path = server
+    size = os.path.getsize(path)
+    response = httpServer.app.test_client().get(f"/videos/{video_id}", headers={"Range": f"bytes={size - 10}-"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {size - 10}-{size - 1}/{size}"
+    assert len(response.data) == 10
+
+
+def test_unsatisfiable_range(server):
+    httpServer, video_id, path = server
+    size = os.path.getsize(path)
+    response = httpServer.app.test_client().get(f"/videos/{video_id}", headers={"Range": f"bytes={size}-"})
+    assert response.status_code == 416
+
+
+def test_revalidation_returns_not_modified(server):
+    httpServer, video_id, _ = server
+    client = httpServer.app.test_client()
+    first = client.get(f"/videos/{video_id}")
+    assert first.status_code == 200
+    assert first.cache_control.max_age == httpServer.MEDIA_MAX_AGE
+
+    by_etag = client.get(f"/videos/{video_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert by_etag.status_code == 304
+    by_date = client.get(f"/videos/{video_id}", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert by_date.status_code == 304
+
+
+def test_preview_falls_back_to_original_until_transcoded(server):
+    httpServer, video_id, path = server
+    client = httpServer.app.test_client()
+    response = client.get(f"/videos/{video_id}?quality=preview")
+    assert response.status_code == 200
+    assert response.data == path.read_bytes()
+    # The browser must revalidate so it switches to the rendition once it exists
+    assert response.cache_control.max_age == 0
+    client.get(f"/videos/{video_id}?quality=preview")
+    assert httpServer.transcoder.jobs.qsize() == 1
+    assert httpServer.transcoder.jobs.get_nowait() == (video_id, path.name)
+
+
+def test_failed_transcode_is_not_retried(server):
+    httpServer, video_id, path = server
+    httpServer.catalog.update(video_id, rendition_failed=1)
+    response = httpServer.app.test_client().get(f"/videos/{video_id}?quality=preview")
+    assert response.status_code == 200
+    assert response.data == path.read_bytes()
+    assert response.cache_control.max_age == httpServer.MEDIA_MAX_AGE
+    assert httpServer.transcoder.jobs.empty()
+
+
+def test_transcoder_worker_records_failures(server, monkeypatch):
+    httpServer, video_id, path = server
+    import renditions
+    monkeypatch.setattr(renditions, "transcode_preview", lambda *args: False)
+    transcoder = httpServer.transcoder
+    transcoder.enqueue(video_id, path.name)
+    worker = renditions.threading.Thread(target=transcoder._worker, daemon=True)
+    worker.start()
+    transcoder.jobs.join()
+    assert httpServer.catalog.get(video_id)["rendition_failed"] == 1
+    assert transcoder.queued == set()
+
+
+def test_preview_serves_rendition_when_ready(server):
+    httpServer, video_id, path = server
+    rendition = httpServer.transcoder.rendition_path(path.name)
+    with open(rendition, "wb") as f:
+        f.write(b"\x00" * 1000)
+
+    client = httpServer.app.test_client()
+    response = client.get(f"/videos/{video_id}?quality=preview", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 0-99/1000"
+    assert client.get(f"/videos/{video_id}?quality=original").content_length == os.path.getsize(path)
+
+
+def test_invalid_quality_and_unknown_video(server):
+    httpServer, video_id, _ = server
+    client = httpServer.app.test_client()
+    assert client.get(f"/videos/{video_id}?quality=4k").status_code == 400
+    assert client.get(f"/videos/{video_id + 1}").status_code == 404
@@ -0,0 +1,40 @@
+"""On-demand thumbnails are queued on the worker pool, never generated on the request thread."""
+import thumbnailer
+from thumbnailer import Thumbnailer
+from video_catalog import VideoCatalog
+
+
+def make_thumbnailer(tmp_path):
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    catalog = VideoCatalog(str(tmp_path / "catalog.db"), str(upload_folder))
+    video_id, filename = catalog.allocate(".mp4", source_name="record_1.mp4")
+    (upload_folder / filename).write_bytes(b"not really a video")
+    catalog.update(video_id, size=18)
+    return Thumbnailer(catalog, str(upload_folder), workers=0), catalog, video_id, filename
+
+
+def test_missing_thumbnail_is_queued_once(tmp_path):
+    pool, _, video_id, filename = make_thumbnailer(tmp_path)
+    assert not pool.ensure(thumbnailer.thumbnail_name(filename))
+    assert not pool.ensure(thumbnailer.preview_name(filename))
+    assert pool.jobs.qsize() == 1
+    assert pool.jobs.get_nowait() == (video_id, filename)
+
+
+def test_failed_clip_is_not_requeued(tmp_path, monkeypatch):
+    pool, catalog, video_id, filename = make_thumbnailer(tmp_path)
+    monkeypatch.setattr(thumbnailer, "generate_thumbnail", lambda *args: False)
+    monkeypatch.setattr(thumbnailer, "generate_preview", lambda *args: False)
+    pool.process(video_id, filename)
+    assert catalog.get(video_id)["thumbnail_failed"] == 1
+
+    assert not pool.ensure(thumbnailer.thumbnail_name(filename))
+    assert pool.jobs.empty()
+
+
+def test_existing_thumbnail_is_served(tmp_path):
+    pool, _, _, filename = make_thumbnailer(tmp_path)
+    (tmp_path / "uploads" / thumbnailer.thumbnail_name(filename)).write_bytes(b"jpeg")
+    assert pool.ensure(thumbnailer.thumbnail_name(filename))
+    assert pool.jobs.empty()
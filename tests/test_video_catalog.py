@@ -0,0 +1,24 @@
+"""VideoCatalog row lifecycle: allocation, publishing and re-uploads."""
+from video_catalog import VideoCatalog
+
+
+def make_catalog(tmp_path):
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    return VideoCatalog(str(tmp_path / "catalog.db"), str(upload_folder))
+
+
+def test_allocated_video_is_listed_once_saved(tmp_path):
+    catalog = make_catalog(tmp_path)
+    video_id, filename = catalog.allocate(".mp4", source_name="record_1.mp4")
+    assert filename == f"{video_id}.mp4"
+    assert catalog.list()[0] == []
+    catalog.update(video_id, size=123)
+    assert [row["filename"] for row in catalog.list()[0]] == [filename]
+
+
+def test_add_reports_reuploads(tmp_path):
+    catalog = make_catalog(tmp_path)
+    video_id, inserted = catalog.add("clip.avi", source_name="clip.avi")
+    assert inserted
+    assert catalog.add("clip.avi", source_name="clip.avi") == (video_id, False)
@@ -0,0 +1,224 @@
+import os
+import queue
+import logging
+import argparse
+import threading
+import subprocess
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WORKERS = 2       # Concurrent ffmpeg processes
+THUMBNAIL_QUEUE_SIZE = 256  # Uploads beyond this are thumbnailed on demand instead
+THUMBNAIL_SEEK = 1.0        # seconds into the clip
+PREVIEW_ENABLED = True      # Also build a multi-frame sprite strip per clip
+PREVIEW_FRAMES = 6
+PREVIEW_WIDTH = 160
+
+def thumbnail_name(video_filename):
+    return f"{os.path.splitext(video_filename)[0]}.jpg"
+
+def preview_name(video_filename):
+    return f"{os.path.splitext(video_filename)[0]}_preview.jpg"
+
+def probe_duration(video_path):
+    """Container duration in seconds (reads headers only), or None."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
+            capture_output=True, text=True, timeout=10
+        )
+        return float(result.stdout.strip())
+    except (ValueError, subprocess.SubprocessError, OSError):
+        return None
+
+def generate_thumbnail(video_path, thumbnail_path, seek=THUMBNAIL_SEEK):
+    """
+    Generate a thumbnail using FFmpeg.
+    -ss is given before -i so ffmpeg seeks in the demuxer and only decodes from the
+    nearest keyframe, instead of decoding everything up to the timestamp.
+    """
+    for position in (seek, 0):
+        try:
+            subprocess.run(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-ss', f"{position:.3f}", '-i', video_path,
+                 '-frames:v', '1', thumbnail_path],
+                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
+            )
+        except subprocess.CalledProcessError as e:
+            logger.error(f"FFmpeg error: {e.stderr.decode()}")
+            return False
+        except subprocess.TimeoutExpired:
+            logger.error(f"FFmpeg timed out generating thumbnail for {video_path}")
+            return False
+        except OSError as e:
+            logger.error(f"Could not run FFmpeg: {e}")
+            return False
+        # Clips shorter than the seek point produce no frame; retry from the start
+        if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
+            logger.info(f"Thumbnail generated: {thumbnail_path}")
+            return True
+    return False
+
+def generate_preview(video_path, preview_path, frames=PREVIEW_FRAMES, width=PREVIEW_WIDTH):
+    """Builds a single-row sprite of `frames` evenly spaced frames, `width` px each."""
+    duration = probe_duration(video_path)
+    if not duration:
+        return False
+    rate = frames / duration
+    try:
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-i', video_path,
+             '-vf', f"fps={rate:.6f},scale={width}:-2,tile={frames}x1",
+             '-frames:v', '1', preview_path],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60
+        )
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error: {e.stderr.decode()}")
+        return False
+    except subprocess.TimeoutExpired:
+        logger.error(f"FFmpeg timed out generating preview for {video_path}")
+        return False
+    except OSError as e:
+        logger.error(f"Could not run FFmpeg: {e}")
+        return False
+    logger.info(f"Preview generated: {preview_path}")
+    return True
+
+
+class Thumbnailer:
+    """
+    Bounded worker pool for thumbnails and previews. Uploads and image requests only
+    enqueue work, so no HTTP response ever waits on ffmpeg. Results are recorded in the
+    catalog. A dropped job is queued again the next time the image is requested; a clip
+    ffmpeg failed on is marked thumbnail_failed and only retried by backfill(force=True).
+    """
+
+    def __init__(self, catalog, upload_folder, workers=THUMBNAIL_WORKERS,
+                 queue_size=THUMBNAIL_QUEUE_SIZE, preview=PREVIEW_ENABLED):
+        self.catalog = catalog
+        self.upload_folder = upload_folder
+        self.preview = preview
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.in_progress = {}
+        self.queued = set()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"thumbnailer-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def enqueue(self, video_id, video_filename):
+        """Queues thumbnail (and preview) generation. Returns False if the queue is full."""
+        with self.lock:
+            if video_filename in self.queued:
+                return True
+            try:
+                self.jobs.put_nowait((video_id, video_filename))
+            except queue.Full:
+                logger.warning(f"Thumbnail queue full; {video_filename} will be queued again when requested.")
+                return False
+            self.queued.add(video_filename)
+            return True
+
+    def _worker(self):
+        while True:
+            video_id, video_filename = self.jobs.get()
+            try:
+                self.process(video_id, video_filename)
+            except Exception as e:
+                logger.error(f"Thumbnail job failed for {video_filename}: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(video_filename)
+                self.jobs.task_done()
+
+    def _event_for(self, video_filename):
+        """Per-video event so concurrent requests for the same clip share one ffmpeg run."""
+        with self.lock:
+            event = self.in_progress.get(video_filename)
+            if event is not None:
+                return event, False
+            event = self.in_progress[video_filename] = threading.Event()
+            return event, True
+
+    def process(self, video_id, video_filename, force=False):
+        """Generates any missing thumbnail/preview for one video and records them in the catalog."""
+        event, owner = self._event_for(video_filename)
+        if not owner:
+            event.wait(60)
+            return
+        try:
+            video_path = os.path.join(self.upload_folder, video_filename)
+            if not os.path.exists(video_path):
+                return
+            with timed("thumbnail_seconds", "Thumbnail + preview generation per video"):
+                fields = {"thumbnail_failed": 0}
+                thumb = thumbnail_name(video_filename)
+                thumb_path = os.path.join(self.upload_folder, thumb)
+                if force or not os.path.exists(thumb_path):
+                    if generate_thumbnail(video_path, thumb_path):
+                        fields["thumbnail"] = thumb
+                    else:
+                        fields["thumbnail_failed"] = 1
+                else:
+                    fields["thumbnail"] = thumb
+                if self.preview:
+                    preview = preview_name(video_filename)
+                    preview_path = os.path.join(self.upload_folder, preview)
+                    if force or not os.path.exists(preview_path):
+                        if generate_preview(video_path, preview_path):
+                            fields["preview"] = preview
+                        else:
+                            fields["thumbnail_failed"] = 1
+                    else:
+                        fields["preview"] = preview
+            if video_id is not None:
+                self.catalog.update(video_id, **fields)
+        finally:
+            with self.lock:
+                self.in_progress.pop(video_filename, None)
+            event.set()
+
+    def ensure(self, image_filename):
+        """
+        Called for a requested thumbnail/preview image. Returns True if it exists; otherwise
+        queues its generation (unless ffmpeg already failed on the clip) and returns False
+        without waiting, so the request can answer 404 straight away.
+        """
+        image_path = os.path.join(self.upload_folder, image_filename)
+        if os.path.exists(image_path):
+            return True
+        stem = os.path.splitext(image_filename)[0]
+        if stem.endswith("_preview"):
+            stem = stem[:-len("_preview")]
+        row = self.catalog.get_by_filename(f"{stem}.mp4")
+        if row is not None and not row["thumbnail_failed"]:
+            self.enqueue(row["id"], row["filename"])
+        return False
+
+    def backfill(self, force=False):
+        """Generates thumbnails/previews for every catalogued MP4 that is missing them."""
+        count = 0
+        for row in self.catalog.iter_all():
+            if not row["filename"] or not row["filename"].lower().endswith(".mp4"):
+                continue
+            self.process(row["id"], row["filename"], force=force)
+            count += 1
+        return count
+
+
+if __name__ == "__main__":
+    from video_catalog import VideoCatalog
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill thumbnails and previews for existing clips.")
+    parser.add_argument("--db", default="catalog.db")
+    parser.add_argument("--videos", default="videos")
+    parser.add_argument("--force", action="store_true", help="regenerate even if the images already exist")
+    parser.add_argument("--no-preview", action="store_true")
+    args = parser.parse_args()
+    thumbnailer = Thumbnailer(VideoCatalog(args.db, args.videos), args.videos, workers=0,
+                              preview=not args.no_preview)
+    print(f"Processed {thumbnailer.backfill(force=args.force)} video(s).")
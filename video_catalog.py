@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT UNIQUE,
+    source_name TEXT,
+    timestamp TEXT,
+    thumbnail TEXT,
+    result TEXT,
+    label TEXT,
+    size INTEGER,                  -- set once the file is saved; NULL while an upload is in progress
+    preview TEXT,
+    rendition TEXT,
+    timeline TEXT,                 -- JSON list of per-segment scores
+    thumbnail_failed INTEGER,      -- 1 when ffmpeg could not build the thumbnail/preview
+    rendition_failed INTEGER       -- 1 when the preview rendition could not be transcoded
+);
+CREATE INDEX IF NOT EXISTS idx_videos_label ON videos (label, id);
+CREATE INDEX IF NOT EXISTS idx_videos_source ON videos (source_name);
+-- Results that arrived before their clip; applied when the clip is uploaded
+CREATE TABLE IF NOT EXISTS pending_results (
+    source_name TEXT PRIMARY KEY,
+    result TEXT,
+    timestamp TEXT,
+    timeline TEXT
+);
+"""
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 200
+
+_LABEL_RE = re.compile(r"Suspicious activity detected: (\w+)")
+
+def label_from_result(result):
+    """Maps an inference result string to a filterable label (e.g. "Theft", "Violence", "None")."""
+    if not result:
+        return None
+    match = _LABEL_RE.search(result)
+    if match:
+        return match.group(1)
+    if "No suspicious activity" in result:
+        return "None"
+    return None
+
+
+class VideoCatalog:
+    """
+    SQLite index of uploaded videos, so the dashboard never has to scan the upload folder.
+    Ids are allocated inside a write transaction, which makes the incrementing
+    filenames safe when several uploads arrive at once.
+    """
+
+    def __init__(self, db_path, upload_folder):
+        self.db_path = db_path
+        self.upload_folder = upload_folder
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        if conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0] == 0:
+            self.import_existing()
+
+    def _migrate(self, conn):
+        """Adds columns introduced after a catalog was first created."""
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(videos)")}
+        for column, column_type in (("preview", "TEXT"), ("rendition", "TEXT"), ("timeline", "TEXT"),
+                                    ("thumbnail_failed", "INTEGER"), ("rendition_failed", "INTEGER")):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE videos ADD COLUMN {column} {column_type}")
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def import_existing(self, allowed_extensions=(".mp4", ".avi", ".mkv", ".mov")):
+        """One-off backfill from files already in the upload folder."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name in sorted(os.listdir(self.upload_folder)):
+                stem, ext = os.path.splitext(name)
+                if ext.lower() not in allowed_extensions:
+                    continue
+                path = os.path.join(self.upload_folder, name)
+                thumb = stem + ".jpg"
+                if not os.path.exists(os.path.join(self.upload_folder, thumb)):
+                    thumb = None
+                timestamp = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+                video_id = int(stem) if ext.lower() == ".mp4" and stem.isdigit() else None
+                conn.execute(
+                    "INSERT OR IGNORE INTO videos (id, filename, source_name, timestamp, thumbnail, size) VALUES (?, ?, ?, ?, ?, ?)",
+                    (video_id, name, name, timestamp, thumb, os.path.getsize(path))
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # Attach results from legacy <id>.json files
+        for row in conn.execute("SELECT id, filename FROM videos").fetchall():
+            json_path = os.path.join(self.upload_folder, os.path.splitext(row["filename"])[0] + ".json")
+            if os.path.exists(json_path):
+                try:
+                    with open(json_path) as f:
+                        data = json.load(f)
+                    self.update(row["id"], result=data.get("Result"), timestamp=data.get("Timestamp"))
+                except (OSError, ValueError):
+                    pass
+
+    def allocate(self, ext, source_name=None):
+        """
+        Reserves the next id and returns (id, filename) where filename is "<id><ext>".
+        The row exists before the file is written, so concurrent uploads never collide.
+        It is only listed once update() records the size of the saved file.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO videos (source_name, timestamp) VALUES (?, ?)",
+                (source_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            video_id = cur.lastrowid
+            filename = f"{video_id}{ext}"
+            conn.execute("UPDATE videos SET filename = ? WHERE id = ?", (filename, video_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if source_name:
+            self._apply_pending(video_id, source_name)
+        return video_id, filename
+
+    def add(self, filename, source_name=None):
+        """
+        Registers a file stored under its own name (non-MP4 uploads). Returns (id, inserted);
+        inserted is False when a row for filename already existed (a re-upload).
+        """
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO videos (filename, source_name, timestamp) VALUES (?, ?, ?)",
+            (filename, source_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        video_id = conn.execute("SELECT id FROM videos WHERE filename = ?", (filename,)).fetchone()["id"]
+        return video_id, cur.rowcount == 1
+
+    def update(self, video_id, **fields):
+        fields = {k: v for k, v in fields.items() if v is not None}
+        if "result" in fields:
+            fields["label"] = label_from_result(fields["result"])
+        if not fields:
+            return
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._conn().execute(f"UPDATE videos SET {columns} WHERE id = ?", (*fields.values(), video_id))
+
+    def delete(self, video_id):
+        self._conn().execute("DELETE FROM videos WHERE id = ?", (video_id,))
+
+    def set_result_by_source(self, source_name, result, timestamp=None, timeline=None):
+        """
+        Attaches an inference result (and optional per-segment timeline) to the newest video
+        uploaded as source_name. A result that arrives before its clip is kept and applied
+        when the clip is uploaded; returns None in that case.
+        """
+        timeline = json.dumps(timeline) if timeline is not None else None
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT id FROM videos WHERE source_name = ? ORDER BY id DESC LIMIT 1", (source_name,)
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_results (source_name, result, timestamp, timeline) VALUES (?, ?, ?, ?)",
+                (source_name, result, timestamp, timeline)
+            )
+            return None
+        self.update(row["id"], result=result, timestamp=timestamp, timeline=timeline)
+        return row["id"]
+
+    def _apply_pending(self, video_id, source_name):
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM pending_results WHERE source_name = ?", (source_name,)).fetchone()
+        if row is not None:
+            self.update(video_id, result=row["result"], timestamp=row["timestamp"], timeline=row["timeline"])
+            conn.execute("DELETE FROM pending_results WHERE source_name = ?", (source_name,))
+
+    def get(self, video_id):
+        row = self._conn().execute("SELECT * FROM videos WHERE id = ?", (video_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_by_filename(self, filename):
+        row = self._conn().execute("SELECT * FROM videos WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def iter_all(self):
+        """Streams every catalogued video, oldest first."""
+        for row in self._conn().execute("SELECT * FROM videos WHERE filename IS NOT NULL AND size IS NOT NULL ORDER BY id"):
+            yield dict(row)
+
+    def list(self, cursor=None, limit=DEFAULT_PAGE_SIZE, label=None):
+        """
+        Newest-first page of videos using keyset pagination on id.
+        Returns (videos, next_cursor); next_cursor is None on the last page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        # Rows without a size are still being uploaded; their file isn't complete yet
+        clauses, params = ["filename IS NOT NULL", "size IS NOT NULL"], []
+        if cursor:
+            clauses.append("id < ?")
+            params.append(int(cursor))
+        if label:
+            clauses.append("label = ?")
+            params.append(label)
+        rows = self._conn().execute(
+            f"SELECT * FROM videos WHERE {' AND '.join(clauses)} ORDER BY id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        videos = [dict(r) for r in rows[:limit]]
+        next_cursor = videos[-1]["id"] if len(rows) > limit else None
+        return videos, next_cursor
@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import threading
+
+from metrics import counter
+
+QUEUE_DB = "/home/admin/pi/work_queue.db"
+MAX_ATTEMPTS = 6            # Inference attempts before a clip is dead-lettered
+RETRY_DELAY = 2             # seconds, doubled after every failed attempt...
+MAX_RETRY_DELAY = 300       # ...up to this cap
+HIGH_WATER = 50             # Queue depth at which the sensor is told to back off...
+LOW_WATER = 25              # ...until the depth falls back under this
+
+# pending -> running -> done
+#                    -> pending (retry at next_attempt) -> ... -> dead
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    priority REAL NOT NULL,        -- higher runs first (the trigger time by default)
+    status TEXT NOT NULL,          -- 'pending', 'running', 'done' or 'dead'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    enqueued REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, priority DESC, next_attempt);
+"""
+
+
+class WorkQueue:
+    """
+    Crash-safe inference queue backed by SQLite.
+
+    Every clip is a row, so the pending set survives a restart; rows left 'running' by a
+    crash go back to 'pending' on startup. claim() hands out the highest-priority clips
+    that are due. A failed clip is rescheduled by timestamp (exponential backoff) instead
+    of a worker sleeping on it, and after max_attempts it is moved to 'dead' and left alone.
+    depth() and is_backlogged() let the producer back off when inference falls behind.
+    """
+
+    def __init__(self, db_path=QUEUE_DB, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY,
+                 max_retry_delay=MAX_RETRY_DELAY, high_water=HIGH_WATER, low_water=LOW_WATER):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.high_water = high_water
+        self.low_water = low_water
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.backlogged = False
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.recover()
+        with self.lock:
+            self._update_backlog()
+
+    def recover(self):
+        """Puts clips that were mid-inference when the process died back in the queue."""
+        with self.lock:
+            count = self.conn.execute(
+                "UPDATE jobs SET status = 'pending', updated = ? WHERE status = 'running'", (time.time(),)
+            ).rowcount
+        return count
+
+    # -----------------------------
+    # PRODUCER
+    # -----------------------------
+    def enqueue(self, path, priority=None, requeue=True):
+        """
+        Adds a clip. A clip already waiting keeps its place (its priority can only go up).
+        A finished or dead clip is queued again when requeue is True; rescans pass False.
+        Returns True if the clip is now pending.
+        """
+        path = str(path)
+        now = time.time()
+        priority = now if priority is None else priority
+        with self.ready:
+            row = self.conn.execute("SELECT status FROM jobs WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO jobs (path, priority, status, next_attempt, enqueued, updated) VALUES (?, ?, 'pending', ?, ?, ?)",
+                    (path, priority, now, now, now)
+                )
+            elif row[0] == "pending":
+                self.conn.execute("UPDATE jobs SET priority = MAX(priority, ?) WHERE path = ?", (priority, path))
+            elif row[0] in ("done", "dead") and requeue:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'pending', priority = ?, attempts = 0, next_attempt = ?, last_error = NULL, updated = ? WHERE path = ?",
+                    (priority, now, now, path)
+                )
+            else:
+                return False
+            self._update_backlog()
+            self.ready.notify_all()
+            return True
+
+    def known(self, path):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM jobs WHERE path = ?", (str(path),)).fetchone() is not None
+
+    def discard(self, path):
+        """Forgets a clip (e.g. deleted by retention) so no worker picks it up."""
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE path = ?", (str(path),))
+            self._update_backlog()
+
+    # -----------------------------
+    # CONSUMERS
+    # -----------------------------
+    def claim(self, limit=1):
+        """Marks up to limit due clips as running, highest priority first. Returns their paths."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                paths = [row[0] for row in self.conn.execute(
+                    "SELECT path FROM jobs WHERE status = 'pending' AND next_attempt <= ? ORDER BY priority DESC, enqueued DESC LIMIT ?",
+                    (now, limit)
+                )]
+                self.conn.executemany("UPDATE jobs SET status = 'running', updated = ? WHERE path = ?",
+                                      [(now, p) for p in paths])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return paths
+
+    def wait(self, timeout):
+        """Blocks until something is enqueued, the next retry is due, or timeout seconds pass."""
+        with self.ready:
+            due = self._next_due()
+            if due is not None:
+                timeout = min(timeout, max(0.0, due - time.time()))
+            if timeout > 0:
+                self.ready.wait(timeout)
+
+    def _next_due(self):
+        row = self.conn.execute("SELECT MIN(next_attempt) FROM jobs WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def complete(self, path):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET status = 'done', last_error = NULL, updated = ? WHERE path = ?",
+                              (time.time(), str(path)))
+            self._update_backlog()
+
+    def fail(self, path, error):
+        """
+        Records a failed attempt. Schedules the next one with exponential backoff, or moves
+        the clip to 'dead' after max_attempts. Returns (status, attempts, retry_in_seconds),
+        or None if the clip was not running (discarded or already finished).
+        """
+        now = time.time()
+        with self.ready:
+            row = self.conn.execute("SELECT attempts, status FROM jobs WHERE path = ?", (str(path),)).fetchone()
+            if row is None or row[1] != "running":
+                return None
+            attempts = row[0] + 1
+            if attempts >= self.max_attempts:
+                status, delay = "dead", None
+                counter("work_queue_dead_total", "Clips dead-lettered after exhausting their retries").inc()
+            else:
+                status = "pending"
+                delay = min(self.max_retry_delay, self.retry_delay * (2 ** (attempts - 1)))
+                counter("work_queue_retries_total", "Failed inference attempts scheduled for retry").inc()
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, updated = ? WHERE path = ?",
+                (status, attempts, now + (delay or 0), str(error), now, str(path))
+            )
+            self._update_backlog()
+            self.ready.notify_all()  # a waiting worker may need to shorten its timeout
+            return status, attempts, delay
+
+    # -----------------------------
+    # BACKPRESSURE / STATS
+    # -----------------------------
+    def depth(self):
+        """Clips waiting or being inferred."""
+        with self.lock:
+            return self._depth()
+
+    def _depth(self):
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+
+    def _update_backlog(self):
+        depth = self._depth()
+        if depth >= self.high_water:
+            self.backlogged = True
+        elif depth < self.low_water:
+            self.backlogged = False
+
+    def is_backlogged(self):
+        """True from high_water until the depth drops under low_water; a cheap attribute read."""
+        return self.backlogged
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        counts["backlogged"] = self.backlogged
+        return counts
+
+    def dead_letters(self, limit=100):
+        """Most recent dead clips as (path, attempts, last_error)."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT path, attempts, last_error FROM jobs WHERE status = 'dead' ORDER BY updated DESC LIMIT ?", (limit,)
+            ).fetchall()